@@ -0,0 +1,237 @@
+"""
+Benchmarks of the real-time callback hot paths, in asv (airspeed velocity) style
+
+Each time_* benchmark has a matching track_*_deadline benchmark reporting the
+time per frame as a fraction of the real-time deadline frame_length / fs, so a
+value approaching 1 means the callback path alone would cause dropouts.
+
+Run with ``asv run`` or, without asv installed, ``python -m benchmarks.benchmarks``
+from the repository root to print a table of deadline fractions.
+"""
+
+import timeit
+import numpy as np
+from sk_dsp_comm.pyaudio_helper.pyaudio_helper import DSPIOStream, LoopAudio
+from sk_dsp_comm.pyaudio_helper.sample_formats import paInt16
+from sk_dsp_comm.pyaudio_helper.simulated import SimulatedPyAudio
+from sk_dsp_comm.pyaudio_helper.filter_stages import ParametricEQStage
+
+fs = 48000
+frame_lengths = [64, 256, 1024, 4096]
+channel_counts = [1, 2, 4, 8]
+
+
+def deadline_fraction(func, frame_length, number=200):
+    """
+    Best time per call of func as a fraction of the frame_length / fs deadline
+    """
+    t = min(timeit.repeat(func, number=number, repeat=5)) / number
+    return t / (frame_length / float(fs))
+
+
+def make_stream(frame_length, num_chan, **kwargs):
+    kwargs.setdefault('process', lambda x: x)
+    dsp_io = DSPIOStream(in_idx=0, out_idx=0, frame_length=frame_length, fs=fs, num_chan=num_chan,
+                         t_capture=60, backend=SimulatedPyAudio(fs=fs), **kwargs)
+    dsp_io._reset_session(0, num_chan)
+    return dsp_io
+
+
+class Benchmark(object):
+    params = [frame_lengths, channel_counts]
+    param_names = ['frame_length', 'num_chan']
+    unit = 'fraction of deadline'
+
+    def setup(self, frame_length, num_chan):
+        rng = np.random.RandomState(0)
+        self.frame_length = frame_length
+        self.x = rng.uniform(-0.5, 0.5, (frame_length, num_chan))
+        self.x_int16 = (32767 * self.x).astype(np.int16).ravel()
+        self.in_data = self.x_int16.tobytes()
+
+
+class StereoBenchmark(Benchmark):
+    """
+    Benchmarks of the two channel paths, skipped for other channel counts
+    """
+
+    def setup(self, frame_length, num_chan):
+        if num_chan != 2:
+            raise NotImplementedError('Stereo only')
+        super().setup(frame_length, num_chan)
+        self.dsp_io = make_stream(frame_length, num_chan)
+        self.left, self.right = self.x[:, 0].copy(), self.x[:, 1].copy()
+
+
+class ChannelSplit(Benchmark):
+    """
+    get_channels / pack_channels
+    """
+
+    def setup(self, frame_length, num_chan):
+        super().setup(frame_length, num_chan)
+        self.dsp_io = make_stream(frame_length, num_chan)
+        self.x_in = self.x_int16.astype(np.float32)
+
+    def time_get_channels(self, frame_length, num_chan):
+        self.dsp_io.get_channels(self.x_in)
+
+    def time_pack_channels(self, frame_length, num_chan):
+        self.dsp_io.pack_channels(self.x)
+
+    def track_get_channels_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_get_channels(frame_length, num_chan), frame_length)
+
+    def track_pack_channels_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_pack_channels(frame_length, num_chan), frame_length)
+
+
+class StereoSplit(StereoBenchmark):
+    """
+    get_lr / pack_lr
+    """
+
+    def setup(self, frame_length, num_chan):
+        super().setup(frame_length, num_chan)
+        self.x_in = self.x_int16.astype(np.float32)
+
+    def time_get_lr(self, frame_length, num_chan):
+        self.dsp_io.get_lr(self.x_in)
+
+    def time_pack_lr(self, frame_length, num_chan):
+        self.dsp_io.pack_lr(self.left, self.right)
+
+    def track_get_lr_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_get_lr(frame_length, num_chan), frame_length)
+
+    def track_pack_lr_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_pack_lr(frame_length, num_chan), frame_length)
+
+
+class Capture(Benchmark):
+    """
+    DSP_capture_add_samples(_multi) into a 60 s capture buffer
+    """
+
+    def setup(self, frame_length, num_chan):
+        super().setup(frame_length, num_chan)
+        self.dsp_io = make_stream(frame_length, num_chan)
+        self.mono = self.x[:, 0].copy()
+
+    def time_capture(self, frame_length, num_chan):
+        if num_chan == 1:
+            self.dsp_io.DSP_capture_add_samples(self.mono)
+        else:
+            self.dsp_io.DSP_capture_add_samples_multi(self.x)
+
+    def track_capture_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_capture(frame_length, num_chan), frame_length)
+
+
+class StereoCapture(StereoBenchmark):
+    """
+    DSP_capture_add_samples_stereo into a 60 s capture buffer
+    """
+
+    def time_capture_stereo(self, frame_length, num_chan):
+        self.dsp_io.DSP_capture_add_samples_stereo(self.left, self.right)
+
+    def track_capture_stereo_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_capture_stereo(frame_length, num_chan), frame_length)
+
+
+class LoopAudioSamples(Benchmark):
+    """
+    LoopAudio.get_samples from a 10 s signal
+    """
+
+    def setup(self, frame_length, num_chan):
+        super().setup(frame_length, num_chan)
+        signal = np.zeros((10 * fs, num_chan)) if num_chan > 1 else np.zeros(10 * fs)
+        self.loop = LoopAudio(signal)
+
+    def time_get_samples(self, frame_length, num_chan):
+        self.loop.get_samples(frame_length)
+
+    def track_get_samples_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_get_samples(frame_length, num_chan), frame_length)
+
+
+class CallbackRoundTrip(Benchmark):
+    """
+    bytes -> float -> bytes round trip of a pass through callback, the way
+    the notebook callbacks do it, through SampleConverter and through the
+    process wrapper
+    """
+
+    def setup(self, frame_length, num_chan):
+        super().setup(frame_length, num_chan)
+        self.dsp_io = make_stream(frame_length, num_chan, sample_format=paInt16)
+
+    def time_astype_round_trip(self, frame_length, num_chan):
+        x = np.frombuffer(self.in_data, dtype=np.int16).astype(np.float32)
+        x.astype(np.int16).tobytes()
+
+    def time_converter_round_trip(self, frame_length, num_chan):
+        x = self.dsp_io.in_data_to_float(self.in_data)
+        self.dsp_io.float_to_out_data(x).tobytes()
+
+    def time_process_callback(self, frame_length, num_chan):
+        self.dsp_io.process_callback(self.in_data, frame_length, None, 0)
+
+    def track_astype_round_trip_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_astype_round_trip(frame_length, num_chan), frame_length)
+
+    def track_converter_round_trip_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_converter_round_trip(frame_length, num_chan), frame_length)
+
+    def track_process_callback_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_process_callback(frame_length, num_chan), frame_length)
+
+
+class ParametricEQ(Benchmark):
+    """
+    12 band ParametricEQStage filtering one frame in place
+    """
+
+    def setup(self, frame_length, num_chan):
+        super().setup(frame_length, num_chan)
+        bands = [(fc, 3.0, 2.0) for fc in np.geomspace(30, 16000, 12)]
+        self.eq = ParametricEQStage(bands, fs, num_chan)
+        self.frame = self.x.astype(np.float32) if num_chan > 1 else self.x[:, 0].astype(np.float32)
+
+    def time_eq(self, frame_length, num_chan):
+        self.eq(self.frame)
+
+    def track_eq_deadline(self, frame_length, num_chan):
+        return deadline_fraction(lambda: self.time_eq(frame_length, num_chan), frame_length)
+
+
+def _benchmark_classes(cls=Benchmark):
+    for sub in cls.__subclasses__():
+        yield sub
+        for subsub in _benchmark_classes(sub):
+            yield subsub
+
+
+def main():
+    print('%-50s %8s %8s %12s' % ('benchmark', 'frames', 'chans', 'deadline'))
+    for cls in _benchmark_classes():
+        for name in sorted(dir(cls)):
+            if not name.startswith('track_'):
+                continue
+            for frame_length in frame_lengths:
+                for num_chan in channel_counts:
+                    bench = cls()
+                    try:
+                        bench.setup(frame_length, num_chan)
+                    except NotImplementedError:
+                        # Parameter combination skipped, as asv does
+                        continue
+                    fraction = getattr(bench, name)(frame_length, num_chan)
+                    print('%-50s %8d %8d %11.4f%%' % (cls.__name__ + '.' + name, frame_length, num_chan,
+                                                      100 * fraction))
+
+
+if __name__ == '__main__':
+    main()
@@ -37,7 +37,7 @@ setup(name='pyaudio-helper',
       license='BSD',
       install_requires=requirements.split(),
       extras_require={
-          'extras': ['ipywidgets>=7.6.4,<8']
+          'extras': ['ipywidgets>=7.6.4,<8', 'scipy']
       },
       python_requires='>=3.5',
      )
@@ -1 +1,9 @@
 from . pyaudio_helper import *
+from . sample_formats import *
+from . devices import *
+from . timing import *
+from . latency import *
+from . simulated import *
+from . batch import *
+from . deadline import *
+from . filter_stages import *
@@ -0,0 +1,71 @@
+"""
+Parallel offline rendering of many inputs through stream callbacks
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+__all__ = ['batch_render']
+
+logger = logging.getLogger(__name__)
+
+
+def _render_one(stream_factory, x, render_kwargs):
+    """
+    Render one input through a freshly created DSPIOStream.
+    """
+    dsp_io = stream_factory()
+    try:
+        return dsp_io.render(x, **render_kwargs)
+    finally:
+        dsp_io.close()
+
+
+def batch_render(stream_factory, inputs, processes=None, **render_kwargs):
+    """
+    Render many input files or arrays offline across a process pool.
+
+    Every input is rendered by its own DSPIOStream, created in the worker by
+    calling stream_factory, so no callback or filter state is shared between
+    inputs. stream_factory must be picklable, i.e. a module level function,
+    and should pass backend=SimulatedPyAudio() unless the workers have devices.
+    Results are yielded as they finish, not in input order. An input that
+    fails to render, e.g. a corrupt file, yields the exception it raised in
+    place of its result, and the remaining inputs are still rendered:
+
+    >>> def make_stream():
+    ...     return DSPIOStream(process=my_filter, in_idx=0, out_idx=0, fs=48000,
+    ...                        backend=SimulatedPyAudio())
+    >>> results = dict(batch_render(make_stream, wav_files))
+    >>> failed = [k for k, r in results.items() if isinstance(r, Exception)]
+
+    :param stream_factory: Function with no arguments returning a configured DSPIOStream
+    :param inputs: Sequence of WAV file paths or arrays, see :func:`DSPIOStream.render`
+    :param processes: Number of worker processes, None for one per CPU and 0 to
+                      render serially in this process
+    :param render_kwargs: Extra arguments for :func:`DSPIOStream.render`, e.g. num_chan
+    :return: Generator of (index, RenderResult or exception) tuples, index being the
+             position in inputs
+    """
+    if processes == 0:
+        for k, x in enumerate(inputs):
+            try:
+                result = _render_one(stream_factory, x, render_kwargs)
+            except Exception as e:
+                result = _render_error(k, e)
+            yield k, result
+        return
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(_render_one, stream_factory, x, render_kwargs): k for k, x in enumerate(inputs)}
+        for future in as_completed(futures):
+            k = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = _render_error(k, e)
+            yield k, result
+
+
+def _render_error(k, e):
+    logger.warning('Rendering input %d failed: %r', k, e)
+    return e
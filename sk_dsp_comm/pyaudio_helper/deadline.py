@@ -0,0 +1,65 @@
+"""
+Callback deadline sweeps across frame lengths and sample rates
+"""
+
+import numpy as np
+
+__all__ = ['deadline_sweep']
+
+
+def deadline_sweep(stream_factory, frame_lengths=(64, 128, 256, 512, 1024, 2048), fs_list=(44100, 48000),
+                   budget=0.5, t_sec=2.0, num_chan=1, level=0.1, verbose=False):
+    """
+    Measure a callback's processing time against the frame_length / fs deadline
+    for every combination of frame_length and fs, and recommend the smallest
+    frame length that keeps the p99 processing time within budget.
+
+    Each configuration renders t_sec seconds of uniform noise offline through a
+    fresh stream, see :func:`DSPIOStream.render`, so the callback is driven on a
+    simulated clock and the sweep runs faster than real time.
+
+    :param stream_factory: Function stream_factory(frame_length, fs) returning a configured
+                           DSPIOStream, e.g. with backend=SimulatedPyAudio()
+    :param frame_lengths: Frame lengths to sweep
+    :param fs_list: Sampling frequencies to sweep
+    :param budget: Largest allowed p99 processing time as a fraction of the callback period
+    :param t_sec: Seconds of input rendered per configuration
+    :param num_chan: Number of channels
+    :param level: Peak amplitude of the noise input, full scale is 1
+    :param verbose: Print a table of the results
+    :return: Dictionary with results, a list with one dictionary per configuration
+             (frame_length, fs, period_ms, process time mean/p50/p95/p99/max as
+             fractions of the period, deadline_misses and passes), and
+             recommended, a dictionary mapping each fs to the smallest passing
+             frame length or None if none passes
+    """
+    rng = np.random.RandomState(0)
+    results = []
+    recommended = {}
+    for fs in fs_list:
+        x = rng.uniform(-level, level, (int(t_sec * fs), num_chan))
+        recommended[fs] = None
+        for frame_length in sorted(frame_lengths):
+            dsp_io = stream_factory(frame_length, fs)
+            try:
+                stats = dsp_io.render(x if num_chan > 1 else x[:, 0]).stats
+            finally:
+                dsp_io.close()
+            period_ms = stats['period_ideal_ms']
+            result = {'frame_length': frame_length, 'fs': fs, 'period_ms': period_ms,
+                      'deadline_misses': stats['deadline_misses'], 'n_callbacks': stats['n_callbacks']}
+            for key in ('mean', 'p50', 'p95', 'p99', 'max'):
+                result[key] = stats['process_%s_ms' % key] / period_ms
+            result['passes'] = bool(result['p99'] <= budget)
+            if result['passes'] and recommended[fs] is None:
+                recommended[fs] = frame_length
+            results.append(result)
+    if verbose:
+        print('%8s %8s %10s %8s %8s %8s %8s' % ('fs', 'frames', 'period ms', 'p50', 'p99', 'max', 'passes'))
+        for r in results:
+            print('%8d %8d %10.2f %7.1f%% %7.1f%% %7.1f%% %8s' % (r['fs'], r['frame_length'], r['period_ms'],
+                                                                 100 * r['p50'], 100 * r['p99'],
+                                                                 100 * r['max'], r['passes']))
+        for fs in fs_list:
+            print('fs = %d: recommended frame_length = %s' % (fs, recommended[fs]))
+    return {'results': results, 'recommended': recommended}
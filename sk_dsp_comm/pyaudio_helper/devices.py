@@ -0,0 +1,205 @@
+"""
+Shared PortAudio context and audio device access
+"""
+
+import json
+import logging
+import os
+import threading
+from . sample_formats import paFloat32, paInt32, paInt24, paInt16
+
+__all__ = ['PortAudioContext', 'DeviceRegistry', 'portaudio_context', 'device_registry', 'standard_rates',
+           'standard_formats']
+
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+logger = logging.getLogger(__name__)
+
+standard_rates = (8000, 11025, 16000, 22050, 32000, 44100, 48000, 88200, 96000, 176400, 192000)
+standard_formats = (paInt16, paInt24, paInt32, paFloat32)
+
+
+class PortAudioContext(object):
+    """
+    Reference counted PyAudio instance shared by all users in the process.
+
+    Initializing PortAudio is slow and enumerates every device, so instead of
+    each DSPIOStream creating and terminating its own PyAudio object, they
+    acquire the shared one and release it when done. PortAudio is terminated
+    when the last reference is released.
+    """
+
+    def __init__(self, factory=None, terminate=True):
+        """
+        :param factory: Callable returning a new PyAudio-like object, defaults to pyaudio.PyAudio
+        :param terminate: Terminate the instance when the last reference is released. Pass
+                          False when factory returns an object owned elsewhere.
+        """
+        self.factory = factory
+        self.terminate = terminate
+        self.ref_count = 0
+        self._pa = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a reference to the shared PyAudio instance, creating it if needed.
+
+        :return: The PyAudio instance
+        """
+        with self._lock:
+            if self._pa is None:
+                self._pa = self._new_instance()
+            self.ref_count += 1
+            return self._pa
+
+    def release(self):
+        """
+        Drop a reference, terminating PortAudio when none are left unless
+        the context was created with terminate=False.
+        """
+        with self._lock:
+            if self.ref_count == 0:
+                return
+            self.ref_count -= 1
+            if self.ref_count == 0:
+                if self.terminate:
+                    self._pa.terminate()
+                self._pa = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def _new_instance(self):
+        if self.factory is not None:
+            return self.factory()
+        if pyaudio is None:
+            raise ImportError('PyAudio is required for audio device access')
+        return pyaudio.PyAudio()
+
+
+portaudio_context = PortAudioContext()
+
+
+class DeviceRegistry(object):
+    """
+    Cached audio device list with lazily probed capabilities.
+
+    The device list (name, host API, input and output channel counts and default
+    sample rate) is enumerated once and reused until :func:`DeviceRegistry.refresh`
+    is called. Supported sample rates and formats are only probed on request with
+    is_format_supported, and the answers are cached per device name, optionally
+    in a JSON file so they survive between sessions.
+    """
+
+    def __init__(self, context=None, cache_file=None):
+        """
+        :param context: PortAudioContext to enumerate through, defaults to the shared one
+        :param cache_file: Optional path of a JSON file caching probe results by device name
+        """
+        self.context = portaudio_context if context is None else context
+        self.cache_file = cache_file
+        self._devices = None
+        self._probes = {}
+        self._lock = threading.Lock()
+        if cache_file is not None and os.path.exists(cache_file):
+            with open(cache_file) as f:
+                self._probes = json.load(f)
+
+    def devices(self, refresh=False):
+        """
+        Return the cached device list, enumerating the devices on first use.
+
+        :param refresh: Enumerate the devices again
+        :return: Dictionary keyed by device index of dictionaries with the keys name,
+                 host_api, inputs, outputs and default_fs
+        """
+        if refresh or self._devices is None:
+            self.refresh()
+        return self._devices
+
+    def refresh(self):
+        """
+        Enumerate the devices again, e.g. after plugging in an interface.
+        """
+        devices = {}
+        device_string = str()
+        with self.context as pA:
+            for k in range(pA.get_device_count()):
+                dev = pA.get_device_info_by_index(k)
+                host_api = pA.get_host_api_info_by_index(dev['hostApi'])['name']
+                devices[k] = {'name': dev['name'], 'host_api': host_api,
+                              'inputs': dev['maxInputChannels'], 'outputs': dev['maxOutputChannels'],
+                              'default_fs': dev['defaultSampleRate']}
+                device_string += 'Index %d device name = %s, host api = %s, inputs = %d, outputs = %d\n' % \
+                                 (k, dev['name'], host_api, dev['maxInputChannels'], dev['maxOutputChannels'])
+        logger.debug(device_string)
+        with self._lock:
+            self._devices = devices
+
+    def is_supported(self, idx, direction, fs, sample_format=paInt16, num_chan=1):
+        """
+        Check whether a device supports a stream configuration, probing it only once.
+
+        :param idx: Device index
+        :param direction: 'input' or 'output'
+        :param fs: Sampling frequency
+        :param sample_format: Sample format, e.g. paInt16
+        :param num_chan: Number of channels
+        :return: True if supported
+        """
+        if direction not in ('input', 'output'):
+            raise ValueError("direction must be 'input' or 'output'")
+        name = self.devices()[idx]['name']
+        key = '%s:%d:%d:%d' % (direction, fs, sample_format, num_chan)
+        probes = self._probes.setdefault(name, {})
+        if key not in probes:
+            kwargs = {direction + '_device': idx, direction + '_channels': num_chan,
+                      direction + '_format': sample_format}
+            with self.context as pA:
+                try:
+                    probes[key] = bool(pA.is_format_supported(fs, **kwargs))
+                except ValueError:
+                    probes[key] = False
+            if self.cache_file is not None:
+                self.save_cache()
+        return probes[key]
+
+    def supported_rates(self, idx, direction='output', sample_format=paInt16, num_chan=1, rates=standard_rates):
+        """
+        List the sample rates from rates a device supports.
+
+        :return: list of supported sampling frequencies
+        """
+        # Hold the context over all probes, so PortAudio is initialized once
+        with self.context:
+            return [fs for fs in rates if self.is_supported(idx, direction, fs, sample_format, num_chan)]
+
+    def supported_formats(self, idx, direction='output', fs=None, num_chan=1, formats=standard_formats):
+        """
+        List the sample formats from formats a device supports at fs, which
+        defaults to the device default sample rate.
+
+        :return: list of supported sample formats
+        """
+        with self.context:
+            fs = self.devices()[idx]['default_fs'] if fs is None else fs
+            return [fmt for fmt in formats if self.is_supported(idx, direction, fs, fmt, num_chan)]
+
+    def save_cache(self):
+        """
+        Write the probe results to cache_file.
+        """
+        if self.cache_file is None:
+            raise ValueError('No cache_file was given')
+        with open(self.cache_file, 'w') as f:
+            json.dump(self._probes, f, indent=1, sort_keys=True)
+
+
+device_registry = DeviceRegistry()
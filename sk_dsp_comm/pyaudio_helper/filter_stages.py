@@ -0,0 +1,582 @@
+"""
+Stateful filter stages for block processing in stream callbacks
+
+A filter stage holds its coefficients and filter state from frame to frame in
+preallocated arrays, so callbacks need no b, a and zi globals. The FFT stages
+also filter into preallocated arrays with numpy 2. scipy's lfilter and sosfilt
+have no output arguments, so IIRStage, FIRStage and SOSStage allocate a new
+output and final state each frame, which are copied into the stage's arrays.
+Stages are callable and can be given directly as the process function of a
+DSPIOStream:
+
+>>> stage = SOSStage(signal.butter(4, 1000, fs=48000, output='sos'), num_chan=2)
+>>> DSP_IO = DSPIOStream(process=stage, in_idx=0, out_idx=0, fs=48000, num_chan=2)
+
+Coefficients may be changed while the stream runs, e.g. from a widget callback,
+with set_coefficients. The new design is computed in the calling thread and
+taken over by the audio thread at the start of the next frame, crossfading
+from the old to the new filter output over that frame:
+
+>>> stage.set_coefficients(signal.butter(4, 2000, fs=48000, output='sos'))
+"""
+
+import threading
+import warnings
+import numpy as np
+
+try:
+    from scipy import signal
+except ImportError:
+    warnings.warn("Please install the helpers extras for full functionality", ImportWarning)
+
+__all__ = ['FilterStage', 'IIRStage', 'FIRStage', 'FFTFIRStage', 'PartitionedConvolutionStage', 'fir_stage',
+           'SOSStage', 'ParametricEQStage', 'eq_section']
+
+# Measured number of taps from which FFTFIRStage is faster than FIRStage, by frame
+# length. Frames up to the first length use its tap count, longer frames the last one.
+_fft_crossover = ((256, 8), (512, 16), (1024, 128), (2048, 384), (4096, 512))
+
+# numpy 2 FFTs write into preallocated arrays, older versions allocate and copy.
+# Double precision is used for the FFT stages, as numpy only transforms it without
+# allocating temporaries.
+_fft_out = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+
+class FilterStage(object):
+    """
+    Base class of the filter stages.
+
+    Subclasses implement _filter(x, out) for one frame x, a 1D array for one
+    channel or a (frame_length, num_chan) array, and reset(). The attributes
+    named in _design_names hold the coefficients and the state, and are
+    replaced as a whole by :func:`FilterStage.swap`.
+    """
+
+    _design_names = ()
+
+    def __init__(self, num_chan=1, dtype=np.float32):
+        """
+        :param num_chan: Number of channels, each with its own filter state
+        :param dtype: Data type of the coefficients and the state
+        """
+        self.num_chan = num_chan
+        self.dtype = np.dtype(dtype)
+        self._out = np.zeros(0, dtype=self.dtype)
+        self._pending = None
+        self._swap_lock = threading.Lock()
+        self._frame_shape = None
+        self._fade_out = np.zeros(0, dtype=self.dtype)
+        self._old_y = np.zeros(0, dtype=self.dtype)
+
+    def __call__(self, x, out=None):
+        return self.process(x, out)
+
+    def process(self, x, out=None):
+        """
+        Filter one frame, continuing from the state left by the previous frame.
+
+        :param x: Frame of samples, 1D for one channel or (frame_length, num_chan)
+        :param out: Optional array shaped like x receiving the output. Defaults to x
+                    itself, so the frame is filtered in place, or to a reused buffer
+                    when x is read-only, e.g. a paFloat32 view of the stream bytes.
+        :return: out
+        """
+        if x.ndim > 1 and x.shape[1] != self.num_chan:
+            raise ValueError('Frame has %d channels, the stage has %d' % (x.shape[1], self.num_chan))
+        if out is None:
+            out = x if x.flags.writeable else self._out_buffer(x.shape)
+        self._frame_shape = x.shape
+        # Never wait on the lock here, a swap in progress is taken over next frame
+        if self._pending is not None and self._swap_lock.acquire(False):
+            try:
+                pending, self._pending = self._pending, None
+            finally:
+                self._swap_lock.release()
+            self._crossfade(pending, x, out)
+        else:
+            self._filter(x, out)
+        return out
+
+    def swap(self, stage):
+        """
+        Replace the coefficients and state of this stage by those of stage, a
+        stage of the same class built outside of the audio thread, with a
+        crossfade from the old to the new output over the next frame.
+
+        The swap is atomic with respect to process: a frame is filtered either
+        by the old design, or by both designs with the crossfade. Calling swap
+        again before the next frame replaces the pending design. The state of
+        the old design is carried over when it is compatible with the new one.
+
+        :param stage: Stage holding the new design, with the same design attributes,
+                      number of channels and, for the FFT stages, frame_length
+        """
+        if stage._design_names != self._design_names or stage.num_chan != self.num_chan:
+            raise ValueError('The new design must be a %s with %d channels'
+                             % (type(self).__name__, self.num_chan))
+        if getattr(stage, 'frame_length', None) != getattr(self, 'frame_length', None):
+            raise ValueError('The new design must have frame_length %d' % self.frame_length)
+        # Crossfade buffers for the frame size in use, so process does not allocate them
+        if self._frame_shape is not None:
+            n = int(np.prod(self._frame_shape))
+            if self._old_y.size < n:
+                self._old_y = np.zeros(n, dtype=self.dtype)
+            if len(self._fade_out) != self._frame_shape[0]:
+                self._fade_out = _fade_out_ramp(self._frame_shape[0], self.dtype)
+        with self._swap_lock:
+            self._pending = stage
+
+    def _crossfade(self, new, x, out):
+        """
+        Filter x by the current and the new design, fade between them into out,
+        and take over the new design.
+        """
+        n = len(x)
+        if self._old_y.size < x.size:
+            self._old_y = np.zeros(x.size, dtype=self.dtype)
+        if len(self._fade_out) != n:
+            self._fade_out = _fade_out_ramp(n, self.dtype)
+        new._adopt_state(self)
+        old_y = self._old_y[:x.size].reshape(x.shape)
+        self._filter(x, old_y)
+        new._filter(x, out)
+        old_y -= out
+        old_y *= self._fade_out if x.ndim == 1 else self._fade_out[:, np.newaxis]
+        out += old_y
+        for name in self._design_names:
+            setattr(self, name, getattr(new, name))
+
+    def _adopt_state(self, old):
+        """
+        Continue from the state of the stage old, this stage's design replacing it.
+        Leaves the state cleared when old's state does not fit this design.
+        """
+        pass
+
+    def reset(self):
+        """
+        Clear the filter state
+        """
+        raise NotImplementedError
+
+    def _filter(self, x, out):
+        raise NotImplementedError
+
+    def _out_buffer(self, shape):
+        n = int(np.prod(shape))
+        if self._out.size < n:
+            self._out = np.zeros(n, dtype=self.dtype)
+        return self._out[:n].reshape(shape)
+
+    @staticmethod
+    def _state_view(zi, x):
+        """
+        View of a (..., num_chan) state array matching a 1D or 2D frame
+        """
+        return zi[..., 0] if x.ndim == 1 else zi
+
+
+def _fade_out_ramp(n, dtype):
+    """
+    Raised cosine falling from 1 to 0 over n samples, the weight of the old output
+    """
+    return (0.5 + 0.5 * np.cos(np.pi * (np.arange(n) + 0.5) / n)).astype(dtype)
+
+
+class IIRStage(FilterStage):
+    """
+    Direct form IIR filter b / a with persistent state, see scipy.signal.lfilter.
+
+    High order designs are better run as second-order sections, see :class:`SOSStage`,
+    especially with float32 coefficients.
+    """
+
+    _design_names = ('b', 'a', 'zi')
+
+    def __init__(self, b, a, num_chan=1, dtype=np.float32):
+        """
+        :param b: Numerator coefficients
+        :param a: Denominator coefficients
+        :param num_chan: Number of channels, each with its own filter state
+        :param dtype: Data type of the coefficients and the state
+        """
+        super().__init__(num_chan, dtype)
+        a = np.atleast_1d(np.asarray(a, dtype=np.float64))
+        self.b = (np.atleast_1d(np.asarray(b, dtype=np.float64)) / a[0]).astype(self.dtype)
+        self.a = (a / a[0]).astype(self.dtype)
+        self.zi = np.zeros((max(len(self.b), len(self.a)) - 1, num_chan), dtype=self.dtype)
+
+    def set_coefficients(self, b, a):
+        """
+        Change the filter to b / a, see :func:`FilterStage.swap`
+
+        :param b: Numerator coefficients
+        :param a: Denominator coefficients
+        """
+        self.swap(IIRStage(b, a, self.num_chan, self.dtype))
+
+    def reset(self):
+        self.zi.fill(0)
+
+    def _adopt_state(self, old):
+        if old.zi.shape == self.zi.shape:
+            self.zi[...] = old.zi
+
+    def _filter(self, x, out):
+        zi = self._state_view(self.zi, x)
+        # scipy allocates y and zf on every call, there is no out argument
+        y, zf = signal.lfilter(self.b, self.a, x, axis=0, zi=zi)
+        out[...] = y
+        zi[...] = zf
+
+
+class FIRStage(IIRStage):
+    """
+    Direct form FIR filter with persistent state, see scipy.signal.lfilter.
+    """
+
+    def __init__(self, b, num_chan=1, dtype=np.float32):
+        """
+        :param b: Filter taps
+        :param num_chan: Number of channels, each with its own filter state
+        :param dtype: Data type of the coefficients and the state
+        """
+        super().__init__(b, [1.0], num_chan, dtype)
+
+    def set_coefficients(self, b):
+        """
+        Change the filter taps, see :func:`FilterStage.swap`
+
+        :param b: Filter taps
+        """
+        self.swap(FIRStage(b, self.num_chan, self.dtype))
+
+
+class FFTFIRStage(FilterStage):
+    """
+    FIR filter by overlap-save FFT convolution for frames of a fixed length.
+
+    The filter spectrum is computed once for an FFT of the next power of two
+    of at least frame_length + len(b) - 1 points. The input history, spectrum
+    and FFT output are kept in reused double precision buffers, so with numpy 2
+    a frame is filtered without allocating arrays. The output matches :class:`FIRStage`, with a cost per
+    sample growing with log(len(b)) instead of len(b).
+    """
+
+    _design_names = ('b', 'nfft', 'H', '_buffer', '_spare', '_X', '_y')
+
+    def __init__(self, b, frame_length, num_chan=1, dtype=np.float32):
+        """
+        :param b: Filter taps
+        :param frame_length: Frames per buffer, every frame must have this length
+        :param num_chan: Number of channels, each with its own input history
+        :param dtype: Data type of the output buffer for read-only frames
+        """
+        super().__init__(num_chan, dtype)
+        self.b = np.atleast_1d(np.asarray(b, dtype=np.float64))
+        self.frame_length = frame_length
+        self.nfft = _next_pow2(frame_length + len(self.b) - 1)
+        # Spectrum repeated per channel, as broadcasting the multiply allocates
+        H = np.fft.rfft(self.b, self.nfft)[:, np.newaxis]
+        self.H = np.ascontiguousarray(np.broadcast_to(H, (len(H), num_chan)))
+        # Input history, shifted into the spare buffer each frame as overlapping copies allocate
+        self._buffer = np.zeros((self.nfft, num_chan))
+        self._spare = np.zeros_like(self._buffer)
+        self._X = np.zeros_like(self.H)
+        self._y = np.zeros_like(self._buffer)
+
+    def set_coefficients(self, b):
+        """
+        Change the filter taps, see :func:`FilterStage.swap`
+
+        :param b: Filter taps
+        """
+        self.swap(FFTFIRStage(b, self.frame_length, self.num_chan, self.dtype))
+
+    def reset(self):
+        self._buffer.fill(0)
+
+    def _adopt_state(self, old):
+        # The state is the input history, of which the newest samples carry over
+        n = min(len(old._buffer), len(self._buffer))
+        self._buffer[-n:] = old._buffer[-n:]
+
+    def _filter(self, x, out):
+        n = self.frame_length
+        if len(x) != n:
+            raise ValueError('Frame length %d differs from the stage frame_length %d' % (len(x), n))
+        buf = self._spare
+        buf[:-n] = self._buffer[n:]
+        buf[-n:] = x if x.ndim > 1 else x[:, np.newaxis]
+        self._buffer, self._spare = buf, self._buffer
+        X = _rfft(buf, self.nfft, self._X)
+        np.multiply(X, self.H, out=X)
+        y = _irfft(X, self.nfft, self._y)[-n:]
+        out[...] = y if x.ndim > 1 else y[:, 0]
+
+
+class PartitionedConvolutionStage(FilterStage):
+    """
+    Uniformly partitioned overlap-save convolution with a long impulse response.
+
+    The impulse response is split into partitions of frame_length samples whose
+    2 * frame_length point spectra are computed once. Each frame adds one input
+    spectrum to a frequency-domain delay line of the past spectra, and the output
+    is the inverse FFT of their sum of products with the partition spectra. The
+    latency is one frame, as for direct convolution, and every callback does the
+    same work, one FFT pair and a multiply-accumulate over the delay line, in
+    reused double precision buffers.
+    """
+
+    _design_names = ('n_partitions', '_H', '_fdl', '_products', '_Y', '_y', '_buffer', '_slot')
+
+    def __init__(self, ir, frame_length, num_chan=None, dtype=np.float32):
+        """
+        :param ir: Impulse response, 1D to apply the same response to every channel
+                   or (n_taps, num_chan) for one response per channel, e.g. stereo
+        :param frame_length: Frames per buffer and partition length, every frame
+                             must have this length
+        :param num_chan: Number of channels, defaults to the number of ir channels
+        :param dtype: Data type of the output buffer for read-only frames
+        """
+        ir = np.asarray(ir, dtype=np.float64)
+        if ir.ndim == 1:
+            ir = ir[:, np.newaxis]
+        if num_chan is None:
+            num_chan = ir.shape[1]
+        if ir.shape[1] not in (1, num_chan):
+            raise ValueError('ir has %d channels, the stage has %d' % (ir.shape[1], num_chan))
+        super().__init__(num_chan, dtype)
+        self.frame_length = frame_length
+        self.n_partitions = -(-len(ir) // frame_length)
+        partitions = np.zeros((self.n_partitions * frame_length, ir.shape[1]))
+        partitions[:len(ir)] = ir
+        H = np.fft.rfft(partitions.reshape(self.n_partitions, frame_length, -1), 2 * frame_length, axis=1)
+        H = np.broadcast_to(H, (self.n_partitions, frame_length + 1, num_chan))
+        # Reversed and repeated, so the spectra lining up with the delay line
+        # starting at any slot are one contiguous slice
+        self._H = np.concatenate((H[::-1], H[::-1]))
+        self._fdl = np.zeros((self.n_partitions, frame_length + 1, num_chan), dtype=H.dtype)
+        self._products = np.zeros_like(self._fdl)
+        self._Y = np.zeros((frame_length + 1, num_chan), dtype=H.dtype)
+        self._y = np.zeros((2 * frame_length, num_chan))
+        self._buffer = np.zeros((2 * frame_length, num_chan))
+        self._slot = 0
+
+    def set_coefficients(self, ir):
+        """
+        Change the impulse response, see :func:`FilterStage.swap`
+
+        :param ir: Impulse response, 1D or with one column per channel
+        """
+        self.swap(PartitionedConvolutionStage(ir, self.frame_length, self.num_chan, self.dtype))
+
+    def reset(self):
+        self._fdl.fill(0)
+        self._buffer.fill(0)
+        self._slot = 0
+
+    def _adopt_state(self, old):
+        # The delay line holds input spectra only, independent of the impulse response,
+        # so the newest spectra carry over into the slots behind slot 0 for any length
+        self._buffer[...] = old._buffer
+        age = np.arange(min(old.n_partitions, self.n_partitions))
+        self._fdl[-1 - age] = old._fdl[(old._slot - 1 - age) % old.n_partitions]
+        self._slot = 0
+
+    def _filter(self, x, out):
+        n = self.frame_length
+        if len(x) != n:
+            raise ValueError('Frame length %d differs from the stage frame_length %d' % (len(x), n))
+        buf = self._buffer
+        buf[:n] = buf[n:]
+        buf[n:] = x if x.ndim > 1 else x[:, np.newaxis]
+        # Delay line slot k holds the newest spectrum, slot k - p the one p frames old
+        k = self._slot
+        _rfft(buf, 2 * n, self._fdl[k])
+        start = self.n_partitions - 1 - k
+        np.multiply(self._fdl, self._H[start:start + self.n_partitions], out=self._products)
+        np.sum(self._products, axis=0, out=self._Y)
+        y = _irfft(self._Y, 2 * n, self._y)[n:]
+        out[...] = y if x.ndim > 1 else y[:, 0]
+        self._slot = (k + 1) % self.n_partitions
+
+
+def fir_stage(b, frame_length, num_chan=1, method='auto', dtype=np.float32):
+    """
+    FIR filter stage using direct form or FFT convolution, whichever is cheaper.
+
+    With method='auto' the FFT stage is used from a crossover number of taps
+    measured for each frame length, e.g. 128 taps at frame_length = 1024, 16 at
+    512 and 512 from 4096 on, so longer filters never switch back to direct form.
+
+    :param b: Filter taps
+    :param frame_length: Frames per buffer of the stream
+    :param num_chan: Number of channels
+    :param method: 'auto', 'direct' for :class:`FIRStage` or 'fft' for :class:`FFTFIRStage`
+    :param dtype: Data type of the coefficients and the state
+    :return: FIRStage or FFTFIRStage
+    """
+    if method == 'auto':
+        method = 'fft' if len(b) >= _fft_min_taps(frame_length) else 'direct'
+    if method == 'direct':
+        return FIRStage(b, num_chan, dtype)
+    if method == 'fft':
+        return FFTFIRStage(b, frame_length, num_chan, dtype)
+    raise ValueError("method must be 'auto', 'direct' or 'fft'")
+
+
+def _fft_min_taps(frame_length):
+    for n, taps in _fft_crossover:
+        if frame_length <= n:
+            return taps
+    return _fft_crossover[-1][1]
+
+
+def _next_pow2(n):
+    return 1 << int(np.ceil(np.log2(max(n, 1))))
+
+
+def _rfft(x, n, out):
+    """
+    rfft of n points along axis 0 written into out
+    """
+    if _fft_out:
+        return np.fft.rfft(x, n, axis=0, out=out)
+    out[...] = np.fft.rfft(x, n, axis=0)
+    return out
+
+
+def _irfft(X, n, out):
+    """
+    irfft of n points along axis 0 written into out
+    """
+    if _fft_out:
+        return np.fft.irfft(X, n, axis=0, out=out)
+    out[...] = np.fft.irfft(X, n, axis=0)
+    return out
+
+
+class SOSStage(FilterStage):
+    """
+    Cascade of second-order sections with persistent state, see scipy.signal.sosfilt.
+    """
+
+    _design_names = ('sos', 'zi')
+
+    def __init__(self, sos, num_chan=1, dtype=np.float32):
+        """
+        :param sos: (n_sections, 6) array of second-order sections
+        :param num_chan: Number of channels, each with its own filter state
+        :param dtype: Data type of the coefficients and the state
+        """
+        super().__init__(num_chan, dtype)
+        # Always a copy, so the caller's array cannot change the filter under the audio thread
+        self.sos = np.atleast_2d(np.array(sos, dtype=self.dtype))
+        if self.sos.shape[1] != 6:
+            raise ValueError('sos must have shape (n_sections, 6)')
+        self.zi = np.zeros((len(self.sos), 2, num_chan), dtype=self.dtype)
+
+    def set_coefficients(self, sos):
+        """
+        Change the second-order sections, see :func:`FilterStage.swap`
+
+        :param sos: (n_sections, 6) array of second-order sections
+        """
+        self.swap(SOSStage(sos, self.num_chan, self.dtype))
+
+    def reset(self):
+        self.zi.fill(0)
+
+    def _adopt_state(self, old):
+        if old.zi.shape == self.zi.shape:
+            self.zi[...] = old.zi
+
+    def _filter(self, x, out):
+        zi = self._state_view(self.zi, x)
+        # scipy allocates y and zf on every call, there is no out argument
+        y, zf = signal.sosfilt(self.sos, x, axis=0, zi=zi)
+        out[...] = y
+        zi[...] = zf
+
+
+class ParametricEQStage(SOSStage):
+    """
+    Multi-band parametric equalizer run as one second-order section per band.
+
+    All bands are filtered by a single sosfilt call per frame with persistent
+    state. Changing a band with :func:`ParametricEQStage.set_band` redesigns only
+    that band's section, and crossfades to the new response over one frame:
+
+    >>> eq = ParametricEQStage([(100, 20, 2), (1000, 10, 2), (8000, -10, 2)], fs=48000)
+    >>> eq.set_band(2, gain_db=-6)
+    """
+
+    def __init__(self, bands, fs, num_chan=1, dtype=np.float32):
+        """
+        :param bands: Sequence of (fc, gain_db, Q) or (fc, gain_db, Q, kind) tuples, kind being
+                      'peak' (default), 'lowshelf' or 'highshelf', see :func:`eq_section`
+        :param fs: Sampling frequency
+        :param num_chan: Number of channels, each with its own filter state
+        :param dtype: Data type of the coefficients and the state
+        """
+        self.fs = fs
+        self.bands = [dict(zip(('fc', 'gain_db', 'Q', 'kind'), band)) for band in bands]
+        for band in self.bands:
+            band.setdefault('kind', 'peak')
+        # Designed sections, including changes not yet taken over by the audio thread
+        self._sections = np.array([eq_section(fs=fs, **band) for band in self.bands])
+        super().__init__(self._sections, num_chan, dtype)
+
+    def set_band(self, k, fc=None, gain_db=None, Q=None, kind=None):
+        """
+        Change the parameters of band k, arguments left at None keep their value.
+
+        Only the section of band k is redesigned, in the calling thread. The
+        new sections are swapped in at the next frame with the state carried
+        over, see :func:`FilterStage.swap`.
+
+        :param k: Band index
+        :param fc: Center or corner frequency in Hz
+        :param gain_db: Gain in dB
+        :param Q: Quality factor
+        :param kind: 'peak', 'lowshelf' or 'highshelf'
+        """
+        band = dict(self.bands[k])
+        for key, value in (('fc', fc), ('gain_db', gain_db), ('Q', Q), ('kind', kind)):
+            if value is not None:
+                band[key] = value
+        self._sections[k] = eq_section(fs=self.fs, **band)
+        self.bands[k] = band
+        self.swap(SOSStage(self._sections, self.num_chan, self.dtype))
+
+
+def eq_section(fc, gain_db, Q, fs, kind='peak'):
+    """
+    Second-order section of a peaking or shelving EQ band, following the
+    Audio EQ Cookbook by R. Bristow-Johnson.
+
+    :param fc: Center frequency of a peak, corner frequency of a shelf, in Hz
+    :param gain_db: Gain at fc for a peak, of the shelf otherwise, in dB
+    :param Q: Quality factor, bandwidth of a peak and slope of a shelf
+    :param fs: Sampling frequency
+    :param kind: 'peak', 'lowshelf' or 'highshelf'
+    :return: Section [b0, b1, b2, 1, a1, a2] as a float64 array
+    """
+    A = 10 ** (gain_db / 40.0)
+    w0 = 2 * np.pi * fc / fs
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / (2 * Q)
+    if kind == 'peak':
+        b = [1 + alpha * A, -2 * cos_w0, 1 - alpha * A]
+        a = [1 + alpha / A, -2 * cos_w0, 1 - alpha / A]
+    elif kind in ('lowshelf', 'highshelf'):
+        s = 1 if kind == 'lowshelf' else -1
+        beta = 2 * np.sqrt(A) * alpha
+        b = [A * ((A + 1) - s * (A - 1) * cos_w0 + beta), s * 2 * A * ((A - 1) - s * (A + 1) * cos_w0),
+             A * ((A + 1) - s * (A - 1) * cos_w0 - beta)]
+        a = [(A + 1) + s * (A - 1) * cos_w0 + beta, -s * 2 * ((A - 1) + s * (A + 1) * cos_w0),
+             (A + 1) + s * (A - 1) * cos_w0 - beta]
+    else:
+        raise ValueError("kind must be 'peak', 'lowshelf' or 'highshelf'")
+    return np.array(b + a) / a[0]
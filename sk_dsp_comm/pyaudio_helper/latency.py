@@ -0,0 +1,74 @@
+"""
+Probe signals and delay estimation for round-trip latency measurement
+"""
+
+import numpy as np
+
+__all__ = ['chirp_probe', 'mls_probe', 'estimate_delay']
+
+# Feedback taps of maximum length sequences, as used by scipy.signal.max_len_seq
+_mls_taps = {2: [1], 3: [2], 4: [3], 5: [3], 6: [5], 7: [6], 8: [7, 6, 1], 9: [5], 10: [7], 11: [9],
+             12: [11, 10, 4], 13: [12, 11, 8], 14: [13, 12, 2], 15: [14], 16: [15, 13, 4], 17: [14],
+             18: [11], 19: [18, 17, 14], 20: [17]}
+
+
+def chirp_probe(fs, duration=0.1, f_start=100.0, f_stop=None, level=0.5):
+    """
+    Linear chirp probe with raised cosine tapered ends.
+
+    :param fs: Sampling frequency
+    :param duration: Probe length in seconds
+    :param f_start: Start frequency in Hz
+    :param f_stop: Stop frequency in Hz, defaults to 0.4 fs
+    :param level: Peak amplitude, full scale is 1
+    :return: 1D float array
+    """
+    f_stop = 0.4 * fs if f_stop is None else f_stop
+    t = np.arange(int(duration * fs)) / float(fs)
+    x = np.sin(2 * np.pi * (f_start * t + (f_stop - f_start) / (2 * duration) * t ** 2))
+    n_taper = max(len(x) // 20, 1)
+    taper = 0.5 - 0.5 * np.cos(np.pi * np.arange(n_taper) / n_taper)
+    x[:n_taper] *= taper
+    x[len(x) - n_taper:] *= taper[::-1]
+    return level * x
+
+
+def mls_probe(order=14, level=0.5):
+    """
+    Maximum length sequence probe of 2**order - 1 samples with values +/- level.
+
+    :param order: Number of LFSR bits, 2 to 20
+    :param level: Amplitude, full scale is 1
+    :return: 1D float array
+    """
+    if order not in _mls_taps:
+        raise ValueError('MLS order must be between 2 and 20')
+    taps = _mls_taps[order]
+    state = [1] * order
+    seq = np.zeros(2 ** order - 1)
+    idx = 0
+    for k in range(len(seq)):
+        feedback = state[idx]
+        seq[k] = feedback
+        for tap in taps:
+            feedback ^= state[(tap + idx) % order]
+        state[idx] = feedback
+        idx = (idx + 1) % order
+    return level * (2 * seq - 1)
+
+
+def estimate_delay(probe, captured):
+    """
+    Delay of probe within captured, from the peak of their FFT cross-correlation.
+
+    :param probe: Probe signal that was played
+    :param captured: Signal recorded while playing the probe
+    :return: Tuple (delay, peak_ratio), delay in samples and the ratio of the
+             correlation peak to the RMS correlation as a confidence measure
+    """
+    nfft = 1 << int(np.ceil(np.log2(len(captured) + len(probe))))
+    r = np.fft.irfft(np.fft.rfft(captured, nfft) * np.conj(np.fft.rfft(probe, nfft)), nfft)
+    r = np.abs(r[:len(captured)])
+    delay = int(np.argmax(r))
+    rms = np.sqrt(np.mean(r ** 2))
+    return delay, r[delay] / rms if rms > 0 else np.inf
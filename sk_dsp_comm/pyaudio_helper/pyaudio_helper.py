@@ -39,8 +39,14 @@ except ImportError:
     warnings.warn("Please install the helpers extras for full functionality", ImportWarning)
 import time
 import matplotlib.pyplot as plt
-from threading import Thread
+from collections import namedtuple
+from threading import Thread, Event
 from . interactive_widgets import InteractiveWidgets
+from . sample_formats import SampleConverter, paInt16, paInt24
+from . devices import PortAudioContext, DeviceRegistry, portaudio_context, device_registry
+from . simulated import read_wav
+from . latency import chirp_probe, mls_probe, estimate_delay
+from . timing import paContinue, paComplete, CallbackTimer, StatusLog, LatencyTracker, timing_stats, perf_counter_ns
 
 logger = logging.getLogger(__name__)
 
@@ -54,12 +60,18 @@ class DSPIOStream(InteractiveWidgets):
     Mark Wickert, Andrew Smit September 2017
     """
 
-    def __init__(self, stream_callback, in_idx=1, out_idx=4, frame_length=1024, fs=44100, t_capture=0, sleep_time=0.1,
+    def __init__(self, stream_callback=None, in_idx=1, out_idx=4, frame_length=1024, fs=44100, t_capture=0, sleep_time=0.1,
                  t_sec: int = 2,
-                 num_chan: int = 1):
+                 num_chan: int = 1,
+                 sample_format=paInt16,
+                 process=None,
+                 process_out=False,
+                 timing_records=65536,
+                 backend=None):
         """
 
-        :param stream_callback: Function that will provide the callback functionality
+        :param stream_callback: Function that will provide the callback functionality,
+                                not needed when process is given
         :param in_idx: Input device id
         :param out_idx: Output device id
         :param frame_length:
@@ -67,41 +79,110 @@ class DSPIOStream(InteractiveWidgets):
         :param t_capture: Time to capture (seconds)
         :param sleep_time:
         :param t_sec: Stream time > 0 for capture, otherwise 0 for no interrupt
-        :param num_chan: Number of channels 1 or 2
+        :param num_chan: Number of channels, 1 for mono, 2 for stereo or more for multichannel devices
+        :param sample_format: Stream sample format, paInt16 (default), paInt24, paInt32 or paFloat32
+        :param process: Optional block processing function y = process(x) used in place of
+                        stream_callback, see :func:`DSPIOStream.process_callback`
+        :param process_out: When True, process is called as process(x, out) and writes its
+                            output into the preallocated out array instead of returning it
+        :param timing_records: Number of callbacks kept by the callback timer
+        :param backend: Optional PyAudio-like object to use instead of the shared PortAudio
+                        context, e.g. a :class:`SimulatedPyAudio` for running without hardware
         """
         super().__init__()
+        if stream_callback is None and process is None:
+            raise ValueError('Either stream_callback or process must be given')
+        self.backend = backend
+        if backend is None:
+            self.device_registry = device_registry
+        else:
+            # The caller owns the backend, the registry must not terminate it
+            self.device_registry = DeviceRegistry(PortAudioContext(factory=lambda: backend, terminate=False))
         self.in_idx = in_idx
         self.out_idx = out_idx
-        self.in_out_check()
+        # Acquire before checking the devices, so the check reuses this PortAudio instance
+        self.p = portaudio_context.acquire() if backend is None else backend
+        try:
+            self.in_out_check()
+        except Exception:
+            self.close()
+            raise
         self.frame_length = frame_length
         self.fs = fs
         self.sleep_time = sleep_time
-        self.stream_callback = stream_callback
-        self.p = pyaudio.PyAudio()
+        self.process = process
+        self.process_out = process_out
+        self.stream_callback = stream_callback if stream_callback is not None else self.process_callback
         self.stream_data = False
         self.stop_stream = False
+        self.stream_done = Event()
+        self.N_samples = 0
         self.capture_sample_count = 0
-        self.data_capture = list()
-        self.data_capture_left = list()
-        self.data_capture_right = list()
         self.Tcapture = t_capture
         self.Tsec = t_sec
         self.numChan = num_chan
         self.Ncapture = int(self.fs * self.Tcapture)
+        self.capture_buffer = CaptureBuffer(self.Ncapture)
+        self.capture_buffer_multi = CaptureBuffer(self._multi_capture_length(), num_chan=max(self.numChan, 2))
         self.left_in = np.zeros(frame_length)
         self.right_in = np.zeros(frame_length)
-        self.out = np.zeros(frame_length * 2)
+        self.out = np.zeros(frame_length * max(num_chan, 2))
+        self.sample_format = sample_format
+        self.converter = SampleConverter(sample_format, frame_length, num_chan)
+        self.process_y = np.zeros(self._process_out_shape(num_chan), dtype=np.float32)
         self.interactiveFG = False
         self.print_when_done = 1
-        self.DSP_tic = list()
-        self.DSP_toc = list()
+        self.timer = CallbackTimer(timing_records)
+        self.status_log = StatusLog()
+        self.latency = LatencyTracker()
+        self.callback_count = 0
+        self.start_time = time.time()
+
+    @property
+    def data_capture(self):
+        """
+        Captured samples in chronological order, at most Ncapture of the newest
+        samples passed to :func:`DSPIOStream.DSP_capture_add_samples`.
+
+        """
+        return self.capture_buffer.get()
+
+    @property
+    def data_capture_multi(self):
+        """
+        Captured multichannel samples in chronological order as an (N, num_chan)
+        array, filled by :func:`DSPIOStream.DSP_capture_add_samples_multi` or
+        :func:`DSPIOStream.DSP_capture_add_samples_stereo`.
+
+        """
+        return self.capture_buffer_multi.get()
+
+    @property
+    def data_capture_left(self):
+        """
+        Left channel (column 0) view of :attr:`DSPIOStream.data_capture_multi`
+
+        """
+        return self.data_capture_multi[:, 0]
+
+    @property
+    def data_capture_right(self):
+        """
+        Right channel (column 1) view of :attr:`DSPIOStream.data_capture_multi`
+
+        """
+        return self.data_capture_multi[:, 1]
+
+    def _multi_capture_length(self):
+        # The multichannel store is only allocated for streams with more than one channel
+        return self.Ncapture if self.numChan > 1 else 0
 
     def in_out_check(self):
         """
         Checks the input and output to see if they are valid
 
         """
-        devices = available_devices()
+        devices = self.device_registry.devices()
         if not self.in_idx in devices:
             raise OSError("Input device is unavailable")
         in_check = devices[self.in_idx]
@@ -148,7 +229,8 @@ class DSPIOStream(InteractiveWidgets):
         mode. When in infinite mode, the "Stop Streaming" radio button or Tsec.stop() can be
         used to stop the stream.
 
-        num_chan : number of channels. Use 1 for mono and 2 for stereo.
+        num_chan : number of channels. Use 1 for mono, 2 for stereo and more for multichannel
+        devices.
 
 
         """
@@ -169,7 +251,8 @@ class DSPIOStream(InteractiveWidgets):
         t_sec : stream time in seconds if Tsec > 0. If Tsec = 0, then stream goes to infinite
         mode. When in infinite mode, Tsec.stop() can be used to stop the stream.
 
-        num_chan : number of channels. Use 1 for mono and 2 for stereo.
+        num_chan : number of channels. Use 1 for mono, 2 for stereo and more for multichannel
+        devices.
 
         """
 
@@ -192,22 +275,15 @@ class DSPIOStream(InteractiveWidgets):
         t_sec : stream time in seconds if Tsec > 0. If Tsec = 0, then stream goes to infinite
         mode. When in infinite mode, Tsec.stop() can be used to stop the stream.
 
-        num_chan : number of channels. Use 1 for mono and 2 for stereo.
+        num_chan : number of channels. Use 1 for mono, 2 for stereo and more for multichannel
+        devices.
 
         """
-        self.Tsec = t_sec
-        self.numChan = num_chan
-        self.N_samples = int(self.fs * t_sec)
-        self.data_capture = []
-        self.data_capture_left = []
-        self.data_capture_right = []
-        self.capture_sample_count = 0
-        self.DSP_tic = []
-        self.DSP_toc = []
-        self.start_time = time.time()
-        self.stop_stream = False
+        self._reset_session(t_sec, num_chan)
+        if self.p is None:
+            self.p = portaudio_context.acquire()
         # open stream using callback (3)
-        stream = self.p.open(format=pyaudio.paInt16,
+        stream = self.p.open(format=self.sample_format,
                              channels=num_chan,
                              rate=self.fs,
                              input=True,
@@ -215,32 +291,24 @@ class DSPIOStream(InteractiveWidgets):
                              input_device_index=self.in_idx,
                              output_device_index=self.out_idx,
                              frames_per_buffer=self.frame_length,
-                             stream_callback=self.stream_callback)
+                             stream_callback=self._callback)
+        self.latency.record_stream(stream)
 
         # start the stream (4)
         stream.start_stream()
 
-        # infinite mode
-        if (t_sec == 0):
-            while stream.is_active():
-                if self.stop_stream:
-                    stream.stop_stream()
-                time.sleep(self.sleep_time)
-        else:
-            # wait for stream to finish (5)
-            while stream.is_active():
-                if self.capture_sample_count >= self.N_samples:
-                    stream.stop_stream()
-                if self.stop_stream:
-                    stream.stop_stream()
-                time.sleep(self.sleep_time)
+        # wait for stream to finish (5), signalled by the callback or stop(). In
+        # infinite mode (t_sec = 0) only stop() ends the stream. Every sleep_time
+        # check that the stream has not ended on its own, e.g. a callback error.
+        while not self.stream_done.wait(self.sleep_time):
+            if not stream.is_active():
+                break
 
         # stop stream (6)
         stream.stop_stream()
         stream.close()
 
-        # close PyAudio (7)
-        self.p.terminate()
+        # PyAudio is shared and stays open for the next stream, see close() (7)
         self.stream_data = True
         # print('Audio input/output streaming session complete!')
 
@@ -250,12 +318,170 @@ class DSPIOStream(InteractiveWidgets):
         if (self.print_when_done == 1):
             print('Completed')
 
+    def close(self):
+        """
+        Release this object's reference to the shared PortAudio context. PortAudio
+        is terminated once no DSPIOStream holds it. A later stream() call
+        reacquires it, so the object remains usable.
+
+        """
+        if self.p is not None and self.backend is None:
+            self.p = None
+            portaudio_context.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reset_session(self, t_sec, num_chan):
+        """
+        Reset the capture, timing and statistics state and size the buffers
+        for a new stream of t_sec seconds with num_chan channels.
+        """
+        self.Tsec = t_sec
+        self.numChan = num_chan
+        self.N_samples = int(self.fs * t_sec)
+        self.Ncapture = int(self.fs * self.Tcapture)
+        self.capture_buffer.reset(self.Ncapture)
+        self.capture_buffer_multi.reset(self._multi_capture_length(), num_chan=max(num_chan, 2))
+        if len(self.out) != self.frame_length * max(num_chan, 2):
+            self.out = np.zeros(self.frame_length * max(num_chan, 2))
+        if (self.converter.sample_format, self.converter.num_chan) != (self.sample_format, num_chan):
+            self.converter = SampleConverter(self.sample_format, self.frame_length, num_chan)
+        if self.process_y.shape != self._process_out_shape(num_chan):
+            self.process_y = np.zeros(self._process_out_shape(num_chan), dtype=np.float32)
+        self.capture_sample_count = 0
+        self.timer.reset()
+        self.status_log.reset()
+        self.latency.reset()
+        self.callback_count = 0
+        self.start_time = time.time()
+        self.stop_stream = False
+        self.stream_done.clear()
+
+    def render(self, x, num_chan=None, t_sec=0):
+        """
+        Render an input signal offline through the stream callback, frame by
+        frame and as fast as the CPU allows, with no device and no pacing.
+
+        The frames pass through the same callback wrapper as stream(), so capture,
+        timing and statistics are collected the same way. The device indices are
+        not used; construct the object with backend=SimulatedPyAudio() on machines
+        without audio devices.
+
+        Parameters
+        ----------
+        x : input samples in [-1, 1], 1D for mono or (N, num_chan), or a WAV file path.
+            A WAV file must be sampled at fs, it is not resampled.
+        num_chan : number of channels, defaults to the number of columns of x
+        t_sec : stop after t_sec seconds as counted by the capture sample counter,
+                0 renders all of x
+
+        Returns
+        -------
+        result : RenderResult with the output array (same shape as x, ending early
+                 if the callback completed the stream), the data_capture and
+                 data_capture_multi arrays, the DSP_tic and DSP_toc arrays and the
+                 stream_stats dictionary
+
+        """
+        if isinstance(x, str):
+            fs, x = read_wav(x)
+            if fs != self.fs:
+                raise ValueError('WAV sample rate %d Hz does not match the stream rate %d Hz' % (fs, self.fs))
+        x = np.asarray(x, dtype=np.float64)
+        if num_chan is None:
+            num_chan = 1 if x.ndim == 1 else x.shape[1]
+        x = x.reshape(len(x), num_chan)
+        self._reset_session(t_sec, num_chan)
+        n = self.frame_length
+        n_frames = int(np.ceil(len(x) / float(n)))
+        frame = np.zeros((n, num_chan))
+        encoder = SampleConverter(self.sample_format, n, num_chan)
+        decoder = SampleConverter(self.sample_format, n, num_chan)
+        y = np.zeros((n_frames * n, num_chan))
+        input_latency = self.frame_length / float(self.fs)
+        k = 0
+        while k < n_frames:
+            frame[:] = 0
+            frame[:len(x) - k * n] = x[k * n:(k + 1) * n]
+            t = k * input_latency
+            time_info = {'input_buffer_adc_time': t, 'current_time': t + input_latency,
+                         'output_buffer_dac_time': t + 2 * input_latency}
+            out_data, flag = self._callback(encoder.from_float(frame).tobytes(), n, time_info, 0)
+            y[k * n:(k + 1) * n] = decoder.to_float(out_data)[:n * num_chan].reshape(n, num_chan)
+            k += 1
+            if flag != paContinue:
+                break
+        y = y[:min(k * n, len(x))]
+        self.stream_data = True
+        return RenderResult(y[:, 0] if num_chan == 1 else y, self.data_capture, self.data_capture_multi,
+                            self.DSP_tic, self.DSP_toc, self.stream_stats())
+
     def stop(self):
         """
         Call to stop streaming
 
         """
         self.stop_stream = True
+        self.stream_done.set()
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """
+        Stream callback handed to PortAudio, wrapping stream_callback.
+
+        Ends the stream from inside the callback by returning paComplete once
+        t_sec worth of samples have been counted or stop() was called, so the
+        stream stops within one frame and timed runs end on a frame boundary.
+        Status flags (xruns) reported by PortAudio are recorded in status_log and
+        the time_info timestamps in latency.
+
+        """
+        if status:
+            self.status_log.record(status, self.callback_count, (perf_counter_ns() - self.timer.start_ns) * 1e-9)
+        if time_info:
+            self.latency.record(time_info)
+        self.callback_count += 1
+        out_data, flag = self.stream_callback(in_data, frame_count, time_info, status)
+        if flag == paContinue and (self.stop_stream or
+                                   (self.N_samples > 0 and self.capture_sample_count >= self.N_samples)):
+            flag = paComplete
+        if flag != paContinue:
+            self.stream_done.set()
+        return out_data, flag
+
+    def _process_out_shape(self, num_chan):
+        return (self.frame_length,) if num_chan == 1 else (self.frame_length, num_chan)
+
+    def process_callback(self, in_data, frame_count, time_info, status):
+        """
+        Stream callback that wraps the block processing function given as process.
+
+        The input bytes are converted to normalized float32 samples, a 1D array for
+        mono or a (frame_count, num_chan) array otherwise, and passed to process.
+        The output is captured, converted back to the stream sample format and
+        returned. Callback timing and the sample counter are handled here, and the
+        conversion buffers are reused from frame to frame.
+
+        """
+        self.DSP_callback_tic()
+        x = self.converter.to_float(in_data)
+        if self.numChan > 1:
+            x = x.reshape(frame_count, self.numChan)
+        if self.process_out:
+            y = self.process_y[:frame_count]
+            self.process(x, y)
+        else:
+            y = self.process(x)
+        if self.numChan > 1:
+            self.DSP_capture_add_samples_multi(y)
+        else:
+            self.DSP_capture_add_samples(y)
+        out_data = self.converter.from_float(y).tobytes()
+        self.DSP_callback_toc()
+        return out_data, paContinue
 
     def DSP_capture_add_samples(self, new_data):
         """
@@ -263,92 +489,220 @@ class DSPIOStream(InteractiveWidgets):
         If length reaches Tcapture, then the newest samples will be kept. If Tcapture = 0
         then new values are not appended to the data_capture array.
 
+        The samples are written into a preallocated circular buffer of Ncapture
+        samples, so the cost per call only depends on the frame length.
+
+        """
+        self.capture_sample_count += len(new_data)
+        if self.Tcapture > 0:
+            self.capture_buffer.write(new_data)
+
+    def DSP_capture_add_samples_multi(self, new_data):
+        """
+        Append a (frame_length, num_chan) frame of multichannel samples to the
+        data_capture_multi array with a single copy and increment the sample counter
+        by frame_length, so t_sec is honoured for any number of channels. If length
+        reaches Tcapture, then the newest samples will be kept. If Tcapture = 0 then
+        new values are not appended.
+
         """
         self.capture_sample_count += len(new_data)
         if self.Tcapture > 0:
-            self.data_capture = np.hstack((self.data_capture, new_data))
-            if (self.Tcapture > 0) and (len(self.data_capture) > self.Ncapture):
-                self.data_capture = self.data_capture[-self.Ncapture:]
+            self.capture_buffer_multi.write(new_data)
 
     def DSP_capture_add_samples_stereo(self, new_data_left, new_data_right):
         """
         Append new samples to the data_capture_left array and the data_capture_right
-        array and increment the sample counter. If length reaches Tcapture, then the
-        newest samples will be kept. If Tcapture = 0 then new values are not appended
-        to the data_capture array.
+        array and increment the sample counter by the frame length, as
+        :func:`DSPIOStream.DSP_capture_add_samples_multi` does for two channels,
+        so t_sec is honoured. If length reaches Tcapture, then the newest samples
+        will be kept. If Tcapture = 0 then new values are not appended to the
+        data_capture array.
+
+        Both channels are stored as columns of one preallocated (Ncapture, num_chan)
+        circular buffer, data_capture_left and data_capture_right are views of it.
 
         """
-        self.capture_sample_count = self.capture_sample_count + len(new_data_left) + len(new_data_right)
+        self.capture_sample_count += len(new_data_left)
         if self.Tcapture > 0:
-            self.data_capture_left = np.hstack((self.data_capture_left, new_data_left))
-            self.data_capture_right = np.hstack((self.data_capture_right, new_data_right))
-            if (len(self.data_capture_left) > self.Ncapture):
-                self.data_capture_left = self.data_capture_left[-self.Ncapture:]
-            if (len(self.data_capture_right) > self.Ncapture):
-                self.data_capture_right = self.data_capture_right[-self.Ncapture:]
+            self.capture_buffer_multi.write_channels(new_data_left, new_data_right)
 
     def DSP_callback_tic(self):
         """
-        Add new tic time to the DSP_tic list. Will not be called if
-        Tcapture = 0.
+        Add new tic time to the callback timer. Timing is recorded for
+        every stream, independent of Tcapture.
 
         """
-        if self.Tcapture > 0:
-            self.DSP_tic.append(time.time() - self.start_time)
+        self.timer.tic()
 
     def DSP_callback_toc(self):
         """
-        Add new toc time to the DSP_toc list. Will not be called if
-        Tcapture = 0.
+        Add new toc time to the callback timer. Timing is recorded for
+        every stream, independent of Tcapture.
 
         """
-        if self.Tcapture > 0:
-            self.DSP_toc.append(time.time() - self.start_time)
+        self.timer.toc()
+
+    @property
+    def DSP_tic(self):
+        """
+        Array of callback start times in seconds since the stream started,
+        for the newest timing_records callbacks
+
+        """
+        return self.timer.tics()
+
+    @property
+    def DSP_toc(self):
+        """
+        Array of callback end times in seconds since the stream started,
+        for the newest timing_records callbacks
+
+        """
+        return self.timer.tocs()
+
+    def stream_stats(self, verbose=False):
+        """
+        Statistics of callback execution: ideal period between callbacks,
+        measured period between callbacks and its jitter, time spent in the
+        callback (mean, p50, p95, p99 and max), CPU load as a fraction of the
+        callback period and the number of callbacks over that budget. The number
+        of callbacks reporting each PortAudio status flag (input_overflow,
+        output_underflow, ...) is under the key status_counts and the device
+        latency statistics of :func:`DSPIOStream.latency_stats` under latency.
+
+        Parameters
+        ----------
+        verbose : also print a summary
+
+        Returns
+        -------
+        stats : dictionary of statistics with times in ms, see :func:`timing_stats`
+
+        """
+        stats = timing_stats(self.timer.tics(), self.timer.tocs(), self.frame_length / float(self.fs),
+                             self.timer.first_tic)
+        stats['status_counts'] = self.status_log.count_dict()
+        stats['latency'] = self.latency_stats()
+        if verbose:
+            print('Delay (latency) in Entering the Callback the First Time = %6.2f (ms)'
+                  % stats['first_callback_delay_ms'])
+            print('Ideal Callback period = %1.2f (ms)' % stats['period_ideal_ms'])
+            print('Average Callback Period = %1.2f (ms), jitter = %1.2f (ms)'
+                  % (stats['period_mean_ms'], stats['period_jitter_ms']))
+            print('Average Callback process time = %1.2f (ms), p99 = %1.2f (ms), max = %1.2f (ms)'
+                  % (stats['process_mean_ms'], stats['process_p99_ms'], stats['process_max_ms']))
+            print('CPU load = %1.1f%%, callbacks over budget = %d of %d'
+                  % (100 * stats['cpu_load'], stats['deadline_misses'], stats['n_callbacks']))
+            print('Input to output latency = %1.2f (ms), stream reported input = %1.2f (ms), output = %1.2f (ms)'
+                  % (stats['latency']['io']['mean'], stats['latency']['reported_input_ms'],
+                     stats['latency']['reported_output_ms']))
+            print('Status flags: ' + ', '.join('%s = %d' % item for item in sorted(stats['status_counts'].items())))
+        return stats
+
+    def latency_stats(self):
+        """
+        Device latency measured from the callback time_info timestamps, as
+        running statistics (count, mean, std, min, max, last) in ms:
+
+        io : input ADC to output DAC time of the same callback
+        input : input ADC time to callback time
+        output : callback time to output DAC time
 
-    def stream_stats(self):
+        plus reported_input_ms and reported_output_ms, the latencies reported
+        by the stream when it was opened.
+
+        """
+        return self.latency.stats()
+
+    def measure_round_trip_latency(self, probe='chirp', n_trials=5, t_listen=0.5, level=0.5):
         """
-        Display basic statistics of callback execution: ideal period
-        between callbacks, average measured period between callbacks,
-        and average time spent in the callback.
+        Measure the round-trip latency from out_idx back to in_idx through a
+        physical or software loopback, e.g. a cable from line out to line in.
+
+        Each trial streams the probe followed by t_listen seconds of silence on
+        channel 0 while recording the input, and locates the probe in the
+        recording by FFT cross-correlation. stream_callback is restored afterwards.
+
+        Parameters
+        ----------
+        probe : 'chirp', 'mls' or an array holding a custom probe signal
+        n_trials : number of trials to average
+        t_listen : seconds recorded after the probe, must exceed the latency
+        level : probe amplitude, full scale is 1
+
+        Returns
+        -------
+        result : dictionary with the mean and median latency in samples and in ms
+                 and the per trial delays and correlation peak ratios
 
         """
-        Tp = self.frame_length / float(self.fs) * 1000
-        print('Delay (latency) in Entering the Callback the First Time = %6.2f (ms)' \
-              % (self.DSP_tic[0] * 1000,))
-        print('Ideal Callback period = %1.2f (ms)' % Tp)
-        Tmp_mean = np.mean(np.diff(np.array(self.DSP_tic))[1:] * 1000)
-        print('Average Callback Period = %1.2f (ms)' % Tmp_mean)
-        Tprocess_mean = np.mean(np.array(self.DSP_toc) - np.array(self.DSP_tic)) * 1000
-        print('Average Callback process time = %1.2f (ms)' % Tprocess_mean)
+        if isinstance(probe, str):
+            if probe == 'chirp':
+                probe = chirp_probe(self.fs, level=level)
+            elif probe == 'mls':
+                probe = mls_probe(14, level=level)
+            else:
+                raise ValueError("probe must be 'chirp', 'mls' or an array")
+        probe = np.asarray(probe, dtype=np.float64)
+        n_frames = int(np.ceil((len(probe) + t_listen * self.fs) / self.frame_length))
+        n_samples = n_frames * self.frame_length
+        playback = np.zeros(n_samples)
+        playback[:len(probe)] = probe
+        recording = np.zeros(n_samples)
+        position = [0]
+
+        def loopback_callback(in_data, frame_count, time_info, status):
+            k = position[0]
+            recording[k:k + frame_count] = self.converter.to_float(in_data)[::self.numChan][:n_samples - k]
+            y = np.zeros((frame_count, self.numChan))
+            y[:len(playback[k:k + frame_count]), 0] = playback[k:k + frame_count]
+            position[0] = k + frame_count
+            self.capture_sample_count += frame_count
+            return self.converter.from_float(y).tobytes(), paContinue
+
+        saved = (self.stream_callback, self.Tsec, self.print_when_done)
+        self.stream_callback = loopback_callback
+        self.print_when_done = 0
+        delays = np.zeros(n_trials, dtype=np.int64)
+        peak_ratios = np.zeros(n_trials)
+        try:
+            for trial in range(n_trials):
+                position[0] = 0
+                recording[:] = 0
+                self.stream(t_sec=n_samples / float(self.fs), num_chan=self.numChan)
+                delays[trial], peak_ratios[trial] = estimate_delay(probe, recording)
+        finally:
+            self.stream_callback, self.Tsec, self.print_when_done = saved
+        return {'latency_samples': np.mean(delays), 'latency_ms': np.mean(delays) / self.fs * 1000,
+                'median_samples': np.median(delays), 'median_ms': np.median(delays) / self.fs * 1000,
+                'delays': delays, 'peak_ratios': peak_ratios}
 
     def cb_active_plot(self, start_ms, stop_ms, line_color='b'):
         """
         Plot timing information of time spent in the callback. This is similar
         to what a logic analyzer provides when probing an interrupt.
 
+        Only the callbacks overlapping [start_ms, stop_ms] are drawn, as a single
+        step trace, so long timing logs render quickly.
+
         cb_active_plot( start_ms,stop_ms,line_color='b')
 
         """
+        DSP_tic = self.timer.tics() * 1000
+        DSP_toc = self.timer.tocs() * 1000
         # Find bounding k values that contain the [start_ms,stop_ms]
-        k_min_idx = np.nonzero(np.ravel(np.array(self.DSP_tic) * 1000 < start_ms))[0]
-        if len(k_min_idx) < 1:
-            k_min = 0
-        else:
-            k_min = k_min_idx[-1]
-        k_max_idx = np.nonzero(np.ravel(np.array(self.DSP_tic) * 1000 > stop_ms))[0]
-        if len(k_min_idx) < 1:
-            k_max = len(self.DSP_tic)
-        else:
-            k_max = k_max_idx[0]
-        for k in range(k_min, k_max):
-            if k == 0:
-                plt.plot([0, self.DSP_tic[k] * 1000, self.DSP_tic[k] * 1000,
-                          self.DSP_toc[k] * 1000, self.DSP_toc[k] * 1000],
-                         [0, 0, 1, 1, 0], 'b')
-            else:
-                plt.plot([self.DSP_toc[k - 1] * 1000, self.DSP_tic[k] * 1000, self.DSP_tic[k] * 1000,
-                          self.DSP_toc[k] * 1000, self.DSP_toc[k] * 1000], [0, 0, 1, 1, 0], 'b')
-        plt.plot([self.DSP_toc[k_max - 1] * 1000, stop_ms], [0, 0], 'b')
+        k_min = max(np.searchsorted(DSP_tic, start_ms) - 1, 0)
+        k_max = np.searchsorted(DSP_tic, stop_ms, side='right')
+        n = k_max - k_min
+        # Each callback is a 0-1-1-0 pulse, joined at 0 to the next one
+        t = np.empty((max(n, 0), 4))
+        t[:, :2] = DSP_tic[k_min:k_max, np.newaxis]
+        t[:, 2:] = DSP_toc[k_min:k_max, np.newaxis]
+        t_start = DSP_toc[k_min - 1] if k_min > 0 else 0
+        t_stop = max(stop_ms, t[-1, -1]) if n > 0 else stop_ms
+        plt.plot(np.hstack((t_start, t.ravel(), t_stop)),
+                 np.hstack((0, np.tile([0, 1, 1, 0], max(n, 0)), 0)), line_color)
 
         plt.xlim([start_ms, stop_ms])
         plt.title(r'Time Spent in the callback')
@@ -356,6 +710,100 @@ class DSPIOStream(InteractiveWidgets):
         plt.xlabel(r'Time (ms)')
         plt.grid();
 
+    def in_data_to_float(self, in_data):
+        """
+        Convert the callback in_data bytes into normalized float32 samples in [-1, 1)
+
+        Parameters
+        ----------
+        in_data : input data from the streaming object in the callback function.
+
+        Returns
+        -------
+        x : 1D float32 array of interleaved samples. For paFloat32 streams this is a
+            view of in_data, otherwise a reused buffer overwritten on the next call.
+
+        """
+        return self.converter.to_float(in_data)
+
+    def float_to_out_data(self, y):
+        """
+        Convert normalized float output samples into the stream sample format,
+        clipping to full scale, for returning from the callback.
+
+        Parameters
+        ----------
+        y : float array of interleaved output samples or a (frame_length, num_chan) array
+
+        Returns
+        -------
+        out : ndarray of raw samples in a reused buffer, use out.tobytes() as the
+              callback return data
+
+        """
+        return self.converter.from_float(y)
+
+    def get_channels(self, in_data, num_chan=None):
+        """
+        Splits incoming interleaved data into channels by viewing it as a
+        (frame_length, num_chan) array, with one column per channel.
+
+        Parameters
+        ----------
+        in_data : input data from the streaming object in the callback function,
+                  either the raw bytes in the stream sample format or an array of samples.
+        num_chan : number of interleaved channels, defaults to the stream channels.
+
+        Returns
+        -------
+        x : (frame_length, num_chan) view of in_data, no samples are copied
+
+        """
+        num_chan = self.numChan if num_chan is None else num_chan
+        if isinstance(in_data, np.ndarray):
+            pass
+        elif isinstance(in_data, (bytes, bytearray, memoryview)):
+            if self.sample_format == paInt24:
+                raise ValueError('Viewing raw paInt24 bytes is not supported, use in_data_to_float')
+            in_data = np.frombuffer(in_data, dtype=self.converter.dtype)
+        else:
+            in_data = np.asarray(in_data)
+        return in_data[:self.frame_length * num_chan].reshape(self.frame_length, num_chan)
+
+    def pack_channels(self, y, out=None):
+        """
+        Interleaves a (frame_length, num_chan) array of output samples, one column
+        per channel, into one array to output and returns the output.
+
+        Parameters
+        ----------
+        y : (frame_length, num_chan) array of samples going to output
+        out : optional array or writable bytes-like object (e.g. bytearray) of
+              frame_length * num_chan samples to pack into. A bytes-like object is
+              filled with samples of the stream sample format. By default the preallocated self.out
+              array is used.
+
+        Returns
+        -------
+        out : interleaved array of samples
+        """
+        out = self._pack_view(out, y.shape[1])
+        self._pack_samples(out, y)
+        return out.reshape(-1)
+
+    def _pack_view(self, out, num_chan):
+        """
+        Return the (frame_length, num_chan) view of the buffer to interleave into.
+        """
+        if out is None:
+            out = self.out
+        elif not isinstance(out, np.ndarray):
+            if self.sample_format == paInt24:
+                raise ValueError('Packing into a raw buffer is not supported for paInt24, use float_to_out_data')
+            # Raw buffers hold samples in the stream format
+            out = np.frombuffer(out, dtype=self.converter.dtype)
+        return out[:self.frame_length * num_chan].reshape(self.frame_length, num_chan)
+
     def get_lr(self, in_data):
         """
         Splits incoming packed stereo data into separate left and right channels
@@ -370,15 +818,17 @@ class DSPIOStream(InteractiveWidgets):
         left_in : array of incoming left channel samples
         right_in : array of incoming right channel samples
 
+        As before, the returned arrays are the preallocated float64 arrays
+        self.left_in and self.right_in, overwritten on the next call. Each is
+        filled with one strided copy instead of a per-sample loop.
+
         """
-        for i in range(0, self.frame_length * 2):
-            if i % 2:
-                self.right_in[(int)(i / 2)] = in_data[i]
-            else:
-                self.left_in[(int)(i / 2)] = in_data[i]
+        x = self.get_channels(in_data, num_chan=2)
+        np.copyto(self.left_in, x[:, 0], casting='unsafe')
+        np.copyto(self.right_in, x[:, 1], casting='unsafe')
         return self.left_in, self.right_in
 
-    def pack_lr(self, left_out, right_out):
+    def pack_lr(self, left_out, right_out, out=None):
         """
         Packs separate left and right channel data into one array to output
         and returns the output.
@@ -387,17 +837,138 @@ class DSPIOStream(InteractiveWidgets):
         ----------
         left_out : left channel array of samples going to output
         right_out : right channel array of samples going to output
+        out : optional array or writable bytes-like object (e.g. bytearray) of
+              frame_length * 2 samples to pack into. A bytes-like object is
+              filled with samples of the stream sample format. By default the preallocated self.out
+              array is used.
 
         Returns
         -------
         out : packed left and right channel array of samples
         """
-        for i in range(0, self.frame_length * 2):
-            if i % 2:
-                self.out[i] = right_out[(int)(i / 2)]
-            else:
-                self.out[i] = left_out[(int)(i / 2)]
-        return self.out
+        out = self._pack_view(out, 2)
+        self._pack_samples(out[:, 0], left_out[:self.frame_length])
+        self._pack_samples(out[:, 1], right_out[:self.frame_length])
+        return out.reshape(-1)
+
+    @staticmethod
+    def _pack_samples(out, y):
+        """
+        Copy samples into an output view, saturating instead of wrapping around
+        when the output holds integer samples.
+        """
+        if np.issubdtype(out.dtype, np.integer):
+            info = np.iinfo(out.dtype)
+            y = np.clip(y, info.min, info.max)
+        np.copyto(out, y, casting='unsafe')
+
+
+RenderResult = namedtuple('RenderResult', ['output', 'data_capture', 'data_capture_multi',
+                                           'DSP_tic', 'DSP_toc', 'stats'])
+
+
+class CaptureBuffer(object):
+    """
+    Preallocated circular buffer holding the newest samples written to it.
+
+    Writes cost O(frame_length) regardless of the buffer size, which keeps
+    long captures (minutes at 48 kHz) cheap inside the audio callback. Use
+    :func:`CaptureBuffer.get` to read the samples back in chronological order.
+    A single channel buffer is 1D, a multichannel buffer is (n_samples, num_chan)
+    with one column per channel.
+    """
+
+    def __init__(self, n_samples, num_chan=1, dtype=np.float64):
+        """
+        :param n_samples: Capacity of the buffer in samples (per channel)
+        :param num_chan: Number of channels
+        :param dtype: Sample data type of the buffer
+        """
+        self.dtype = dtype
+        self.num_chan = num_chan
+        self.buffer = None
+        self.reset(n_samples)
+
+    def reset(self, n_samples=None, num_chan=None):
+        """
+        Empty the buffer, reallocating it only if its shape changes.
+
+        :param n_samples: New capacity in samples, None keeps the current one
+        :param num_chan: New number of channels, None keeps the current one
+        """
+        if n_samples is None:
+            n_samples = len(self.buffer)
+        if num_chan is not None:
+            self.num_chan = num_chan
+        shape = (max(int(n_samples), 0),) if self.num_chan == 1 else (max(int(n_samples), 0), self.num_chan)
+        if self.buffer is None or self.buffer.shape != shape:
+            self.buffer = np.zeros(shape, dtype=self.dtype)
+        self.write_idx = 0
+        self.n_valid = 0
+
+    def __len__(self):
+        return self.n_valid
+
+    def _segments(self, n):
+        """
+        Split a write of n samples into at most two contiguous buffer segments.
+        Yields (buffer_start, data_start, length) and advances the write index.
+        """
+        size = len(self.buffer)
+        if n >= size:
+            # Only the newest samples of the frame fit
+            yield 0, n - size, size
+            self.write_idx = 0
+            self.n_valid = size
+            return
+        n_first = min(n, size - self.write_idx)
+        yield self.write_idx, 0, n_first
+        if n_first < n:
+            yield 0, n_first, n - n_first
+        self.write_idx = (self.write_idx + n) % size
+        self.n_valid = min(self.n_valid + n, size)
+
+    def write(self, new_data):
+        """
+        Write a frame of samples, overwriting the oldest samples once full.
+
+        :param new_data: 1D array of new samples, or (frame_length, num_chan)
+                         array for a multichannel buffer
+        """
+        n = len(new_data)
+        if len(self.buffer) == 0 or n == 0:
+            return
+        for buf_start, data_start, length in self._segments(n):
+            self.buffer[buf_start:buf_start + length] = new_data[data_start:data_start + length]
+
+    def write_channels(self, *channels):
+        """
+        Write one frame given as separate per channel 1D arrays, e.g. left and right.
+
+        :param channels: One array of new samples per buffer channel
+        """
+        if len(channels) != self.num_chan:
+            raise ValueError('Expected %d channels, got %d' % (self.num_chan, len(channels)))
+        n = len(channels[0])
+        if len(self.buffer) == 0 or n == 0:
+            return
+        for buf_start, data_start, length in self._segments(n):
+            dest = self.buffer[buf_start:buf_start + length]
+            for k, chan in enumerate(channels):
+                dest[:, k] = chan[data_start:data_start + length]
+
+    def get(self, n_samples=None):
+        """
+        Return a copy of the newest samples in chronological order.
+
+        :param n_samples: Number of newest samples to return, None for all
+        :return: array of at most n_samples samples (rows for a multichannel buffer)
+        """
+        n = self.n_valid if n_samples is None else min(int(n_samples), self.n_valid)
+        start = (self.write_idx - n) % len(self.buffer) if len(self.buffer) else 0
+        if start + n <= len(self.buffer):
+            return self.buffer[start:start + n].copy()
+        return np.concatenate((self.buffer[start:], self.buffer[:self.write_idx]))
 
 
 class LoopAudio(object):
@@ -437,21 +1008,15 @@ class LoopAudio(object):
         return buffer
 
 
-def available_devices():
+def available_devices(refresh=False):
     """
     Display available input and output audio devices along with their
     port indices.
 
+    The device list is enumerated once and cached, see :class:`DeviceRegistry`.
+
+    :param refresh: Enumerate the devices again instead of using the cached list
     :return:  Dictionary whose keys are the device index, the number of inputs and outputs, and their names.
     :rtype: dict
     """
-    devices = {}
-    pA = pyaudio.PyAudio()
-    device_string = str()
-    for k in range(pA.get_device_count()):
-        dev = pA.get_device_info_by_index(k)
-        devices[k] = {'name': dev['name'], 'inputs': dev['maxInputChannels'], 'outputs': dev['maxOutputChannels']}
-        device_string += 'Index %d device name = %s, inputs = %d, outputs = %d\n' % \
-                         (k, dev['name'], dev['maxInputChannels'], dev['maxOutputChannels'])
-    logger.debug(device_string)
-    return devices
+    return device_registry.devices(refresh=refresh)
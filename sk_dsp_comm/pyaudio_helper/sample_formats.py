@@ -0,0 +1,137 @@
+"""
+Sample format conversion between PortAudio stream buffers and float32 arrays
+
+The format flags below carry the same values as pyaudio.paFloat32, pyaudio.paInt16, ...
+so either may be passed wherever a sample format is expected, and formats can be
+selected without pyaudio being installed.
+"""
+
+import numpy as np
+
+__all__ = ['paFloat32', 'paInt32', 'paInt24', 'paInt16', 'sample_size', 'SampleConverter']
+
+paFloat32 = 1
+paInt32 = 2
+paInt24 = 4
+paInt16 = 8
+
+_formats = {
+    # format: (raw dtype, bytes per sample, full scale)
+    paFloat32: (np.float32, 4, 1.0),
+    paInt32: (np.int32, 4, 2.0 ** 31),
+    paInt24: (np.uint8, 3, 2.0 ** 23),
+    paInt16: (np.int16, 2, 2.0 ** 15),
+}
+
+
+def sample_size(sample_format):
+    """
+    Number of bytes of one sample in the given format.
+
+    :param sample_format: One of paFloat32, paInt32, paInt24 or paInt16
+    :return: Bytes per sample
+    """
+    return _format_info(sample_format)[1]
+
+
+def _format_info(sample_format):
+    if sample_format not in _formats:
+        raise ValueError('Unsupported sample format %r' % (sample_format,))
+    return _formats[sample_format]
+
+
+class SampleConverter(object):
+    """
+    Convert between raw stream bytes and normalized float32 samples using
+    buffers allocated once for a frame_length * num_chan sample frame.
+
+    Integer formats are scaled to [-1, 1) on input, and scaled back with
+    saturating clipping on output. paFloat32 needs no conversion, input is
+    returned as a view of the stream bytes.
+
+    Typical use inside a callback:
+
+    >>> x = DSP_IO.converter.to_float(in_data)
+    >>> y = 0.5 * x
+    >>> return DSP_IO.converter.from_float(y).tobytes(), pyaudio.paContinue
+    """
+
+    def __init__(self, sample_format=paInt16, frame_length=1024, num_chan=1):
+        """
+        :param sample_format: One of paFloat32, paInt32, paInt24 or paInt16
+        :param frame_length: Frames per buffer
+        :param num_chan: Number of interleaved channels
+        """
+        self.dtype, self.sample_size, self.full_scale = _format_info(sample_format)
+        # Scalars typed like the arrays they scale keep numpy in single precision loops
+        self._in_scale = np.float32(1.0 / self.full_scale)
+        self._out_scale = np.float64(self.full_scale) if sample_format == paInt32 else np.float32(self.full_scale)
+        self.sample_format = sample_format
+        self.frame_length = frame_length
+        self.num_chan = num_chan
+        self._allocate(frame_length * num_chan)
+
+    def _allocate(self, n):
+        self.n_alloc = n
+        self.x = np.zeros(n, dtype=np.float32)
+        # Scratch must hold full scale integers exactly for 32 bit output
+        self._scratch = np.zeros(n, dtype=np.float64 if self.sample_format == paInt32 else np.float32)
+        if self.sample_format == paInt24:
+            # 24 bit samples are widened to int32 through a zero padded low byte
+            self._padded = np.zeros((n, 4), dtype=np.uint8)
+            self._int32 = np.zeros(n, dtype='<i4')
+            self.raw = np.zeros(n * 3, dtype=np.uint8)
+        else:
+            self.raw = np.zeros(n, dtype=self.dtype)
+
+    def to_float(self, in_data):
+        """
+        Convert stream bytes into normalized float32 samples.
+
+        :param in_data: Bytes-like buffer of interleaved samples in the stream format
+        :return: 1D float32 array, a view of in_data for paFloat32 and otherwise a
+                 view of a reused buffer that is overwritten on the next call
+        """
+        if self.sample_format == paFloat32:
+            return np.frombuffer(in_data, dtype=np.float32)
+        raw = np.frombuffer(in_data, dtype=self.dtype)
+        n = len(raw) // 3 if self.sample_format == paInt24 else len(raw)
+        if n > self.n_alloc:
+            self._allocate(n)
+        x = self.x[:n]
+        if self.sample_format == paInt24:
+            self._padded[:n, 1:] = raw.reshape(n, 3)
+            np.multiply(self._padded[:n].view('<i4').reshape(n), 2.0 ** -31, out=x, casting='unsafe')
+        else:
+            np.multiply(raw, self._in_scale, out=x, casting='unsafe')
+        return x
+
+    def from_float(self, y):
+        """
+        Convert normalized float samples into the stream format, clipping to full scale.
+
+        :param y: float array of output samples, interleaved or (frame_length, num_chan)
+        :return: ndarray holding the raw output samples, call tobytes() on it or hand
+                 it to anything that accepts a buffer. It is overwritten on the next call.
+        """
+        y = np.ravel(y)
+        if self.sample_format == paFloat32 and y.dtype == np.float32:
+            return y
+        n = len(y)
+        if n > self.n_alloc:
+            self._allocate(n)
+        if self.sample_format == paFloat32:
+            out = self.raw[:n]
+            np.copyto(out, y, casting='unsafe')
+            return out
+        scratch = self._scratch[:n]
+        np.multiply(y, self._out_scale, out=scratch, casting='unsafe')
+        np.clip(scratch, -self.full_scale, self.full_scale - 1, out=scratch)
+        if self.sample_format == paInt24:
+            np.copyto(self._int32[:n], scratch, casting='unsafe')
+            out = self.raw[:n * 3]
+            out.reshape(n, 3)[:] = self._int32[:n].view(np.uint8).reshape(n, 4)[:, :3]
+            return out
+        out = self.raw[:n]
+        np.copyto(out, scratch, casting='unsafe')
+        return out
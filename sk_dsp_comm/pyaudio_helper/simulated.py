@@ -0,0 +1,282 @@
+"""
+Simulated PortAudio backend for running streams without audio hardware
+
+:class:`SimulatedPyAudio` stands in for pyaudio.PyAudio. Pass it as the backend
+of a DSPIOStream to feed the input from an ndarray or WAV file, collect the
+output into an array and drive the callback on a simulated clock, e.g. in CI
+machines with no sound card:
+
+>>> sim = SimulatedPyAudio(input_signal=x, fs=48000)
+>>> DSP_IO = DSPIOStream(callback, in_idx=0, out_idx=0, fs=48000, backend=sim)
+>>> DSP_IO.stream(t_sec=0)
+>>> y = sim.output_signal()
+"""
+
+import threading
+import time
+import wave
+import numpy as np
+from . sample_formats import SampleConverter, sample_size, paInt16, paInt24, paInt32
+from . timing import paContinue
+
+__all__ = ['read_wav', 'write_wav', 'SimulatedPyAudio', 'SimulatedStream']
+
+_wav_formats = {2: paInt16, 3: paInt24, 4: paInt32}
+
+
+def read_wav(filename):
+    """
+    Read a 16, 24 or 32 bit PCM WAV file as normalized float samples.
+
+    :param filename: WAV file path
+    :return: Tuple (fs, x), x is 1D for one channel and (N, num_chan) otherwise
+    """
+    with wave.open(filename, 'rb') as f:
+        fs = f.getframerate()
+        num_chan = f.getnchannels()
+        if f.getsampwidth() not in _wav_formats:
+            raise ValueError('Unsupported WAV sample width %d' % f.getsampwidth())
+        frames = f.readframes(f.getnframes())
+        sample_format = _wav_formats[f.getsampwidth()]
+    x = SampleConverter(sample_format, 0, num_chan).to_float(frames).astype(np.float64)
+    if num_chan > 1:
+        x = x.reshape(-1, num_chan)
+    return fs, x
+
+
+def write_wav(filename, fs, x, sample_format=paInt16):
+    """
+    Write normalized float samples to a PCM WAV file, clipping to full scale.
+
+    :param filename: WAV file path
+    :param fs: Sampling frequency
+    :param x: 1D array for one channel or (N, num_chan) array
+    :param sample_format: paInt16, paInt24 or paInt32
+    """
+    x = np.asarray(x)
+    num_chan = 1 if x.ndim == 1 else x.shape[1]
+    data = SampleConverter(sample_format, len(x), num_chan).from_float(x).tobytes()
+    with wave.open(filename, 'wb') as f:
+        f.setnchannels(num_chan)
+        f.setsampwidth(sample_size(sample_format))
+        f.setframerate(fs)
+        f.writeframes(data)
+
+
+class SimulatedPyAudio(object):
+    """
+    Software stand-in for pyaudio.PyAudio with a configurable device list.
+
+    Streams opened from it read their input from input_signal, or from the
+    output itself in loopback mode, and append their output to an array read
+    back with :func:`SimulatedPyAudio.output_signal`.
+    """
+
+    default_devices = ({'name': 'Simulated Duplex', 'maxInputChannels': 8, 'maxOutputChannels': 8},
+                       {'name': 'Simulated Input', 'maxInputChannels': 2, 'maxOutputChannels': 0},
+                       {'name': 'Simulated Output', 'maxInputChannels': 0, 'maxOutputChannels': 2})
+
+    def __init__(self, input_signal=None, fs=44100, devices=None, loop=False, loopback=False,
+                 loopback_delay=0, input_latency=0.005, output_latency=0.01, realtime=False,
+                 status=None):
+        """
+        :param input_signal: Input samples in [-1, 1], 1D or (N, num_chan), or a WAV file path.
+                             None gives silence until the stream is stopped.
+        :param fs: Default sample rate of the devices
+        :param devices: List of device info dictionaries with at least name, maxInputChannels
+                        and maxOutputChannels, defaults to default_devices
+        :param loop: Loop input_signal instead of completing the stream at its end
+        :param loopback: Feed the output back to the input, like a cable from line out to line in
+        :param loopback_delay: Round-trip delay of the loopback in samples
+        :param input_latency: Reported input latency in seconds, used for time_info
+        :param output_latency: Reported output latency in seconds, used for time_info
+        :param realtime: Pace callbacks to the wall clock instead of running them back to back
+        :param status: Optional function status(callback_index) returning the status flags
+                       passed to that callback, to simulate xruns
+        """
+        if isinstance(input_signal, str):
+            fs, input_signal = read_wav(input_signal)
+        self.input_signal = None if input_signal is None else np.asarray(input_signal, dtype=np.float64)
+        self.fs = fs
+        self.devices = [dict(dev) for dev in (self.default_devices if devices is None else devices)]
+        for dev in self.devices:
+            dev.setdefault('hostApi', 0)
+            dev.setdefault('defaultSampleRate', float(fs))
+        self.loop = loop
+        self.loopback = loopback
+        self.loopback_delay = loopback_delay
+        self.input_latency = input_latency
+        self.output_latency = output_latency
+        self.realtime = realtime
+        self.status = status
+        self.output_frames = []
+        self.terminated = False
+
+    def get_device_count(self):
+        return len(self.devices)
+
+    def get_device_info_by_index(self, idx):
+        info = dict(self.devices[idx])
+        info['index'] = idx
+        return info
+
+    def get_host_api_info_by_index(self, idx):
+        return {'index': idx, 'name': 'Simulated', 'deviceCount': len(self.devices)}
+
+    def get_sample_size(self, sample_format):
+        return sample_size(sample_format)
+
+    def is_format_supported(self, rate, input_device=None, input_channels=None, input_format=None,
+                            output_device=None, output_channels=None, output_format=None):
+        """
+        Any rate and sample format is supported up to the device channel counts.
+        """
+        if input_device is not None and input_channels > self.devices[input_device]['maxInputChannels']:
+            raise ValueError('Invalid number of channels')
+        if output_device is not None and output_channels > self.devices[output_device]['maxOutputChannels']:
+            raise ValueError('Invalid number of channels')
+        return True
+
+    def open(self, rate, channels, format, input=False, output=False, input_device_index=None,
+             output_device_index=None, frames_per_buffer=1024, stream_callback=None, start=True):
+        """
+        Open a callback stream, see pyaudio.PyAudio.open
+        """
+        if stream_callback is None:
+            raise ValueError('The simulated backend only supports callback streams')
+        self.output_frames = []
+        stream = SimulatedStream(self, rate, channels, format, frames_per_buffer, stream_callback)
+        if start:
+            stream.start_stream()
+        return stream
+
+    def output_signal(self):
+        """
+        :return: Output of the last stream as floats in [-1, 1], 1D for one
+                 channel or (N, num_chan)
+        """
+        if not self.output_frames:
+            return np.zeros(0)
+        return np.concatenate(self.output_frames)
+
+    def terminate(self):
+        self.terminated = True
+
+
+class SimulatedStream(object):
+    """
+    Stream returned by :func:`SimulatedPyAudio.open`, calling the callback from
+    a thread with input and time_info generated on a simulated clock.
+    """
+
+    def __init__(self, backend, rate, channels, sample_format, frames_per_buffer, stream_callback):
+        self.backend = backend
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.stream_callback = stream_callback
+        self.converter = SampleConverter(sample_format, frames_per_buffer, channels)
+        self.input_pointer = 0
+        self.callback_count = 0
+        self.active = False
+        self._stop_request = threading.Event()
+        self._thread = None
+        if backend.loopback:
+            if backend.loopback_delay < frames_per_buffer:
+                raise ValueError('loopback_delay must be at least frames_per_buffer samples')
+            # Delay line holding the next loopback_delay input samples
+            self._loopback = np.zeros((backend.loopback_delay, channels))
+        self._silence = np.zeros((frames_per_buffer, channels))
+
+    def get_input_latency(self):
+        return self.backend.input_latency
+
+    def get_output_latency(self):
+        return self.backend.output_latency
+
+    def get_time(self):
+        """
+        Simulated stream time in seconds
+        """
+        return self.callback_count * self.frames_per_buffer / float(self.rate)
+
+    def is_active(self):
+        return self.active
+
+    def is_stopped(self):
+        return not self.active
+
+    def start_stream(self):
+        if self.active:
+            return
+        self.active = True
+        self._stop_request.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop_stream(self):
+        self._stop_request.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.active = False
+
+    def close(self):
+        self.stop_stream()
+
+    def _next_input(self):
+        """
+        Next (frames_per_buffer, channels) input frame, None once a finite input is exhausted
+        """
+        n = self.frames_per_buffer
+        if self.backend.loopback:
+            frame = self._loopback[:n]
+            self._loopback = self._loopback[n:]
+            return frame
+        x = self.backend.input_signal
+        if x is None:
+            return self._silence
+        if self.input_pointer >= len(x):
+            if not self.backend.loop:
+                return None
+            self.input_pointer = 0
+        frame = x[self.input_pointer:self.input_pointer + n]
+        self.input_pointer += n
+        if self.backend.loop and len(frame) < n:
+            self.input_pointer = n - len(frame)
+            frame = np.concatenate((frame, x[:self.input_pointer]))
+        if frame.ndim == 1:
+            frame = frame[:, np.newaxis]
+        # Duplicate or drop input channels to match the stream
+        frame = frame[:, np.arange(self.channels) % frame.shape[1]]
+        if len(frame) < n:
+            frame = np.concatenate((frame, self._silence[len(frame):]))
+        return frame
+
+    def _run(self):
+        n = self.frames_per_buffer
+        t_start = time.perf_counter()
+        while not self._stop_request.is_set():
+            frame = self._next_input()
+            if frame is None:
+                break
+            in_data = self.converter.from_float(frame).tobytes()
+            t = self.get_time()
+            time_info = {'input_buffer_adc_time': t,
+                         'current_time': t + self.backend.input_latency,
+                         'output_buffer_dac_time': t + self.backend.input_latency + self.backend.output_latency}
+            status = self.backend.status(self.callback_count) if self.backend.status is not None else 0
+            out_data, flag = self.stream_callback(in_data, n, time_info, status)
+            y = self.converter.to_float(out_data)[:n * self.channels].reshape(-1, self.channels)
+            self.backend.output_frames.append(y[:, 0].copy() if self.channels == 1 else y.copy())
+            if self.backend.loopback:
+                self._loopback = np.concatenate((self._loopback, y))
+            self.callback_count += 1
+            if flag != paContinue:
+                break
+            if self.backend.realtime:
+                time.sleep(max(t_start + self.get_time() - time.perf_counter(), 0))
+            else:
+                # Let other threads, e.g. one calling stop(), run between callbacks
+                time.sleep(0)
+        self.active = False
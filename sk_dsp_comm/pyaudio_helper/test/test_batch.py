@@ -0,0 +1,67 @@
+import os
+import tempfile
+from unittest import TestCase
+import numpy as np
+from numpy import testing as npt
+from sk_dsp_comm.pyaudio_helper.pyaudio_helper import DSPIOStream
+from sk_dsp_comm.pyaudio_helper.simulated import SimulatedPyAudio, write_wav
+from sk_dsp_comm.pyaudio_helper.batch import batch_render
+
+
+class Accumulator(object):
+    """
+    Running sum across frames, so shared state between inputs would show up
+    """
+
+    def __init__(self):
+        self.total = 0.0
+
+    def __call__(self, x):
+        y = np.cumsum(x) + self.total
+        self.total = y[-1]
+        return 0.01 * y
+
+
+def make_stream():
+    return DSPIOStream(process=Accumulator(), in_idx=0, out_idx=0, frame_length=64, fs=8000,
+                       backend=SimulatedPyAudio())
+
+
+class TestBatchRender(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.inputs = [rng.uniform(-0.1, 0.1, 500 + 100 * k) for k in range(4)]
+
+    def expected(self, x):
+        return 0.01 * np.cumsum(x.astype(np.float32))
+
+    def test_batch_render_pool(self):
+        results = dict(batch_render(make_stream, self.inputs, processes=2))
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        for k, x in enumerate(self.inputs):
+            npt.assert_almost_equal(results[k].output, self.expected(x), decimal=3)
+            self.assertEqual(results[k].stats['n_callbacks'], int(np.ceil(len(x) / 64.0)))
+
+    def test_batch_render_serial_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            files = []
+            for k, x in enumerate(self.inputs[:2]):
+                files.append(os.path.join(tmp, '%d.wav' % k))
+                write_wav(files[-1], 8000, x)
+            results = dict(batch_render(make_stream, files, processes=0))
+        for k, x in enumerate(self.inputs[:2]):
+            npt.assert_almost_equal(results[k].output, self.expected(x), decimal=3)
+
+    def test_batch_render_corrupt_input(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            corrupt = os.path.join(tmp, 'corrupt.wav')
+            with open(corrupt, 'wb') as f:
+                f.write(b'not a wav file')
+            inputs = [self.inputs[0], corrupt, self.inputs[1]]
+            for processes in (0, 2):
+                results = dict(batch_render(make_stream, inputs, processes=processes))
+                self.assertEqual(sorted(results), [0, 1, 2])
+                self.assertIsInstance(results[1], Exception)
+                npt.assert_almost_equal(results[2].output, self.expected(self.inputs[1]), decimal=3)
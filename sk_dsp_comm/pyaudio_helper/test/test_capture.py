@@ -0,0 +1,45 @@
+from unittest import TestCase
+import numpy as np
+from numpy import testing as npt
+from sk_dsp_comm.pyaudio_helper.pyaudio_helper import CaptureBuffer
+
+
+class TestCaptureBuffer(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_capture_partial(self):
+        cb = CaptureBuffer(10)
+        cb.write(np.arange(4))
+        npt.assert_equal(cb.get(), np.arange(4))
+
+    def test_capture_wrap_keeps_newest(self):
+        cb = CaptureBuffer(10)
+        for k in range(7):
+            cb.write(np.arange(3 * k, 3 * k + 3))
+        npt.assert_equal(cb.get(), np.arange(11, 21))
+        npt.assert_equal(cb.get(4), np.arange(17, 21))
+
+    def test_capture_frame_longer_than_buffer(self):
+        cb = CaptureBuffer(5)
+        cb.write(np.arange(12))
+        npt.assert_equal(cb.get(), np.arange(7, 12))
+
+    def test_capture_empty(self):
+        cb = CaptureBuffer(0)
+        cb.write(np.arange(12))
+        self.assertEqual(len(cb.get()), 0)
+
+    def test_capture_multichannel_columns(self):
+        cb = CaptureBuffer(6, num_chan=2)
+        for k in range(4):
+            left = np.arange(4 * k, 4 * k + 4)
+            cb.write_channels(left, -left)
+        npt.assert_equal(cb.get()[:, 0], np.arange(10, 16))
+        npt.assert_equal(cb.get()[:, 1], -np.arange(10, 16))
+
+    def test_capture_multichannel_frames(self):
+        cb = CaptureBuffer(5, num_chan=3)
+        frame = np.arange(12).reshape(4, 3)
+        cb.write(frame)
+        cb.write(frame + 12)
+        npt.assert_equal(cb.get(), np.arange(9, 24).reshape(5, 3))
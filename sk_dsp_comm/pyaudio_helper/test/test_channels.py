@@ -0,0 +1,96 @@
+from unittest import TestCase
+import numpy as np
+from numpy import testing as npt
+from sk_dsp_comm.pyaudio_helper.pyaudio_helper import DSPIOStream
+from sk_dsp_comm.pyaudio_helper.simulated import SimulatedPyAudio
+
+
+def loop_get_lr(in_data, frame_length):
+    """
+    Per-sample loop of the original get_lr
+    """
+    left_in, right_in = np.zeros(frame_length), np.zeros(frame_length)
+    for i in range(0, frame_length * 2):
+        if i % 2:
+            right_in[i // 2] = in_data[i]
+        else:
+            left_in[i // 2] = in_data[i]
+    return left_in, right_in
+
+
+def loop_pack_lr(left_out, right_out, frame_length):
+    """
+    Per-sample loop of the original pack_lr
+    """
+    out = np.zeros(frame_length * 2)
+    for i in range(0, frame_length * 2):
+        out[i] = right_out[i // 2] if i % 2 else left_out[i // 2]
+    return out
+
+
+class TestLR(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        self.frame_length = 16
+        self.dsp_io = DSPIOStream(process=lambda x: x, in_idx=0, out_idx=0, frame_length=self.frame_length,
+                                  num_chan=2, backend=SimulatedPyAudio())
+        rng = np.random.RandomState(0)
+        self.x_int16 = rng.randint(-32768, 32767, 2 * self.frame_length).astype(np.int16)
+
+    def test_get_lr_matches_loop(self):
+        in_data = np.frombuffer(self.x_int16.tobytes(), dtype=np.int16)
+        left, right = self.dsp_io.get_lr(in_data)
+        left_ref, right_ref = loop_get_lr(in_data, self.frame_length)
+        npt.assert_equal(left, left_ref)
+        npt.assert_equal(right, right_ref)
+        self.assertEqual(left.dtype, np.float64)
+        # Writable float64 copies, as returned by the loop
+        left *= 0.5
+        right += 1
+        self.assertIs(left, self.dsp_io.left_in)
+
+    def test_pack_lr_matches_loop(self):
+        left, right = loop_get_lr(self.x_int16, self.frame_length)
+        y = self.dsp_io.pack_lr(0.5 * left, right)
+        npt.assert_equal(y, loop_pack_lr(0.5 * left, right, self.frame_length))
+
+    def test_pack_lr_bytearray_saturates(self):
+        left = np.full(self.frame_length, 40000.0)
+        right = np.full(self.frame_length, -40000.0)
+        out = bytearray(4 * self.frame_length)
+        self.dsp_io.pack_lr(left, right, out=out)
+        y = np.frombuffer(out, dtype=np.int16)
+        npt.assert_equal(y[0::2], 32767)
+        npt.assert_equal(y[1::2], -32768)
+        left, right = loop_get_lr(self.x_int16, self.frame_length)
+        self.dsp_io.pack_lr(left, right, out=out)
+        npt.assert_equal(np.frombuffer(out, dtype=np.int16), self.x_int16)
+
+
+class TestChannels(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        self.frame_length = 16
+        self.dsp_io = DSPIOStream(process=lambda x: x, in_idx=0, out_idx=0, frame_length=self.frame_length,
+                                  num_chan=4, backend=SimulatedPyAudio())
+        rng = np.random.RandomState(1)
+        self.x_int16 = rng.randint(-32768, 32767, 4 * self.frame_length).astype(np.int16)
+
+    def test_get_channels(self):
+        x = self.dsp_io.get_channels(self.x_int16)
+        self.assertEqual(x.shape, (self.frame_length, 4))
+        npt.assert_equal(x[:, 2], self.x_int16[2::4])
+        self.assertTrue(np.shares_memory(x, self.x_int16))
+        # Raw callback bytes are viewed in the stream sample format
+        npt.assert_equal(self.dsp_io.get_channels(self.x_int16.tobytes()), x)
+        npt.assert_equal(self.dsp_io.get_channels(self.x_int16, num_chan=2)[:, 1], self.x_int16[1:32:2])
+
+    def test_pack_channels(self):
+        x = self.dsp_io.get_channels(self.x_int16).astype(np.float64)
+        npt.assert_equal(self.dsp_io.pack_channels(x), self.x_int16)
+        out = bytearray(2 * 4 * self.frame_length)
+        self.dsp_io.pack_channels(2 * x, out=out)
+        y = np.frombuffer(out, dtype=np.int16)
+        npt.assert_equal(y, np.clip(2 * self.x_int16.astype(np.int64), -32768, 32767))
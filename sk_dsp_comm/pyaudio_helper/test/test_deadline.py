@@ -0,0 +1,26 @@
+import itertools
+from unittest import TestCase, mock
+from numpy import testing as npt
+from sk_dsp_comm.pyaudio_helper.pyaudio_helper import DSPIOStream
+from sk_dsp_comm.pyaudio_helper.simulated import SimulatedPyAudio
+from sk_dsp_comm.pyaudio_helper.deadline import deadline_sweep
+
+
+def make_stream(frame_length, fs):
+    return DSPIOStream(process=lambda x: x, in_idx=0, out_idx=0, frame_length=frame_length, fs=fs,
+                       backend=SimulatedPyAudio(fs=fs))
+
+
+class TestDeadlineSweep(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_recommendation(self):
+        # Callback timer clock advancing 0.5 ms per reading, so every callback takes exactly 0.5 ms
+        clock = itertools.count(0, 500000)
+        with mock.patch('sk_dsp_comm.pyaudio_helper.timing.perf_counter_ns', lambda: next(clock)):
+            sweep = deadline_sweep(make_stream, frame_lengths=(64, 128, 512), fs_list=(48000, 8000),
+                                   budget=0.3, t_sec=0.1)
+        self.assertEqual(sweep['recommended'], {48000: 128, 8000: 64})
+        self.assertEqual(len(sweep['results']), 6)
+        npt.assert_allclose([r['p99'] for r in sweep['results'][:3]], [0.375, 0.1875, 0.046875])
+        self.assertEqual([r['passes'] for r in sweep['results'][:3]], [False, True, True])
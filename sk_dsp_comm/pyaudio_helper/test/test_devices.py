@@ -0,0 +1,107 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from sk_dsp_comm.pyaudio_helper.devices import PortAudioContext, DeviceRegistry, portaudio_context, \
+    device_registry
+from sk_dsp_comm.pyaudio_helper.pyaudio_helper import DSPIOStream
+
+
+class FakePyAudio(object):
+    instances = 0
+    enumerations = 0
+    probes = 0
+
+    def __init__(self):
+        FakePyAudio.instances += 1
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+    def get_device_count(self):
+        FakePyAudio.enumerations += 1
+        return 2
+
+    def get_device_info_by_index(self, k):
+        return {'name': 'dev%d' % k, 'hostApi': 0, 'maxInputChannels': 2 * k,
+                'maxOutputChannels': 2, 'defaultSampleRate': 48000.0}
+
+    def get_host_api_info_by_index(self, k):
+        return {'name': 'ALSA'}
+
+    def is_format_supported(self, rate, **kwargs):
+        FakePyAudio.probes += 1
+        if rate > 48000:
+            raise ValueError('Invalid sample rate')
+        return True
+
+
+class TestPortAudioContext(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_shared_instance(self):
+        ctx = PortAudioContext(factory=FakePyAudio)
+        p1 = ctx.acquire()
+        p2 = ctx.acquire()
+        self.assertIs(p1, p2)
+        ctx.release()
+        self.assertFalse(p1.terminated)
+        ctx.release()
+        self.assertTrue(p1.terminated)
+        self.assertEqual(ctx.ref_count, 0)
+
+    def test_reacquire_after_terminate(self):
+        ctx = PortAudioContext(factory=FakePyAudio)
+        with ctx as p1:
+            pass
+        with ctx as p2:
+            self.assertIsNot(p1, p2)
+            self.assertFalse(p2.terminated)
+
+
+class TestDeviceRegistry(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_devices_cached(self):
+        registry = DeviceRegistry(PortAudioContext(factory=FakePyAudio))
+        count = FakePyAudio.enumerations
+        devices = registry.devices()
+        self.assertEqual(devices[1], {'name': 'dev1', 'host_api': 'ALSA', 'inputs': 2,
+                                      'outputs': 2, 'default_fs': 48000.0})
+        registry.devices()
+        self.assertEqual(FakePyAudio.enumerations, count + 1)
+        registry.devices(refresh=True)
+        self.assertEqual(FakePyAudio.enumerations, count + 2)
+
+    def test_probe_cache_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_file = os.path.join(tmp, 'devices.json')
+            registry = DeviceRegistry(PortAudioContext(factory=FakePyAudio), cache_file=cache_file)
+            self.assertEqual(registry.supported_rates(0, rates=(44100, 48000, 96000)), [44100, 48000])
+            probes = FakePyAudio.probes
+            registry = DeviceRegistry(PortAudioContext(factory=FakePyAudio), cache_file=cache_file)
+            self.assertEqual(registry.supported_rates(0, rates=(44100, 48000, 96000)), [44100, 48000])
+            self.assertEqual(FakePyAudio.probes, probes)
+
+    def test_probes_share_one_instance(self):
+        registry = DeviceRegistry(PortAudioContext(factory=FakePyAudio))
+        instances = FakePyAudio.instances
+        self.assertEqual(registry.supported_rates(1), [8000, 11025, 16000, 22050, 32000, 44100, 48000])
+        self.assertEqual(len(registry.supported_formats(1)), 4)
+        self.assertEqual(FakePyAudio.instances, instances + 2)
+
+
+class TestStreamContext(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_stream_initializes_portaudio_once(self):
+        with mock.patch.object(portaudio_context, 'factory', FakePyAudio), \
+                mock.patch.object(device_registry, '_devices', None):
+            instances = FakePyAudio.instances
+            dsp_io = DSPIOStream(process=lambda x: x, in_idx=1, out_idx=1)
+            self.assertEqual(FakePyAudio.instances, instances + 1)
+            self.assertEqual(portaudio_context.ref_count, 1)
+            dsp_io.close()
+            with self.assertRaises(ValueError):
+                DSPIOStream(process=lambda x: x, in_idx=0, out_idx=0)
+            self.assertEqual(portaudio_context.ref_count, 0)
@@ -0,0 +1,272 @@
+import tracemalloc
+from unittest import TestCase, SkipTest, skipUnless
+import numpy as np
+from numpy import testing as npt
+try:
+    from scipy import signal
+except ImportError:
+    raise SkipTest('The filter stages need scipy, install the helpers extras')
+from sk_dsp_comm.pyaudio_helper.pyaudio_helper import DSPIOStream
+from sk_dsp_comm.pyaudio_helper.simulated import SimulatedPyAudio
+from sk_dsp_comm.pyaudio_helper import filter_stages
+from sk_dsp_comm.pyaudio_helper.filter_stages import FIRStage, IIRStage, SOSStage, FFTFIRStage, \
+    PartitionedConvolutionStage, ParametricEQStage, fir_stage, eq_section
+
+
+def run_frames(stage, x, frame_length):
+    """
+    Filter x frame by frame through stage
+    """
+    y = np.zeros_like(x, dtype=np.float32)
+    for k in range(0, len(x), frame_length):
+        frame = x[k:k + frame_length].astype(np.float32)
+        y[k:k + frame_length] = stage(frame)
+    return y
+
+
+class TestFilterStages(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.x = rng.uniform(-0.5, 0.5, 4096)
+        self.x2 = rng.uniform(-0.5, 0.5, (4096, 2))
+
+    def test_fir_matches_lfilter(self):
+        b = signal.firwin(31, 0.2)
+        y = run_frames(FIRStage(b), self.x, 256)
+        npt.assert_allclose(y, signal.lfilter(b, 1, self.x), atol=1e-5)
+
+    def test_iir_matches_lfilter(self):
+        b, a = signal.butter(2, 0.1)
+        y = run_frames(IIRStage(2 * b, 2 * a), self.x, 100)
+        npt.assert_allclose(y, signal.lfilter(b, a, self.x), atol=1e-4)
+
+    def test_sos_multichannel_state(self):
+        sos = signal.butter(6, 0.05, output='sos')
+        stage = SOSStage(sos, num_chan=2)
+        y = run_frames(stage, self.x2, 256)
+        self.assertEqual(y.dtype, np.float32)
+        npt.assert_allclose(y, signal.sosfilt(sos, self.x2, axis=0), atol=1e-4)
+        stage.reset()
+        self.assertFalse(stage.zi.any())
+
+    def test_in_place_and_read_only(self):
+        stage = FIRStage([0.5])
+        x = np.ones(8, dtype=np.float32)
+        self.assertIs(stage(x), x)
+        npt.assert_equal(x, 0.5)
+        x.flags.writeable = False
+        y = stage(x)
+        self.assertIsNot(y, x)
+        npt.assert_equal(y, 0.25)
+        with self.assertRaises(ValueError):
+            stage(np.ones((8, 2), dtype=np.float32))
+
+    def test_stream_process(self):
+        sos = signal.butter(4, 0.1, output='sos')
+        dsp_io = DSPIOStream(process=SOSStage(sos), in_idx=0, out_idx=0, frame_length=256, fs=8000,
+                             backend=SimulatedPyAudio(fs=8000))
+        result = dsp_io.render(0.5 * self.x)
+        npt.assert_allclose(result.output, signal.sosfilt(sos, 0.5 * self.x), atol=1e-3)
+
+
+class TestFFTFIRStage(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        rng = np.random.RandomState(2)
+        self.x2 = rng.uniform(-0.5, 0.5, (4096, 2))
+        self.b = signal.firwin(513, 0.1)
+
+    def test_matches_lfilter(self):
+        stage = FFTFIRStage(self.b, 256, num_chan=2)
+        self.assertEqual(stage.nfft, 1024)
+        y = run_frames(stage, self.x2, 256)
+        npt.assert_allclose(y, signal.lfilter(self.b, 1, self.x2, axis=0), atol=1e-5)
+        y = run_frames(FFTFIRStage(self.b, 256), self.x2[:, 0], 256)
+        npt.assert_allclose(y, signal.lfilter(self.b, 1, self.x2[:, 0]), atol=1e-5)
+        with self.assertRaises(ValueError):
+            stage(np.zeros((128, 2), dtype=np.float32))
+
+    @skipUnless(filter_stages._fft_out, 'FFTs into preallocated arrays need numpy 2')
+    def test_frames_reuse_buffers(self):
+        frame = self.x2[:256].astype(np.float32)
+        for stage in (FFTFIRStage(self.b, 256, num_chan=2), PartitionedConvolutionStage(self.b, 256, num_chan=2)):
+            stage(frame)
+            tracemalloc.start()
+            for k in range(10):
+                stage(frame)
+            # Only small Python objects, no spectrum or frame sized arrays
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.assertLess(peak, 4096)
+
+    def test_auto_method(self):
+        self.assertIsInstance(fir_stage(self.b[:15], 1024), FIRStage)
+        self.assertIsInstance(fir_stage(self.b, 1024), FFTFIRStage)
+        self.assertIsInstance(fir_stage(self.b, 1024, method='direct'), FIRStage)
+        with self.assertRaises(ValueError):
+            fir_stage(self.b, 1024, method='fast')
+
+    def test_auto_method_monotonic(self):
+        # Once the FFT stage is chosen, longer filters keep it
+        for frame_length in (32, 64, 256, 512, 1024, 2048, 4096, 8192):
+            fft = [isinstance(fir_stage(np.ones(n), frame_length), FFTFIRStage) for n in range(1, 1100, 7)]
+            self.assertEqual(fft, sorted(fft), frame_length)
+            self.assertTrue(fft[-1])
+
+
+class TestPartitionedConvolutionStage(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.x2 = rng.uniform(-0.5, 0.5, (4096, 2))
+        # Decaying noise reverb tails, not a multiple of the frame length
+        self.ir = rng.randn(1000, 2) * np.exp(-np.arange(1000) / 200.0)[:, np.newaxis]
+
+    def test_stereo_ir(self):
+        stage = PartitionedConvolutionStage(self.ir, 128)
+        self.assertEqual((stage.num_chan, stage.n_partitions), (2, 8))
+        y = run_frames(stage, self.x2, 128)
+        for c in range(2):
+            npt.assert_allclose(y[:, c], np.convolve(self.x2[:, c], self.ir[:, c])[:4096], atol=1e-4)
+
+    def test_mono_ir(self):
+        y = run_frames(PartitionedConvolutionStage(self.ir[:, 0], 64, num_chan=2), self.x2, 64)
+        npt.assert_allclose(y[:, 1], np.convolve(self.x2[:, 1], self.ir[:, 0])[:4096], atol=1e-4)
+        stage = PartitionedConvolutionStage(self.ir[:, 0], 64)
+        y = run_frames(stage, self.x2[:, 0], 64)
+        npt.assert_allclose(y, np.convolve(self.x2[:, 0], self.ir[:, 0])[:4096], atol=1e-4)
+        stage.reset()
+        npt.assert_equal(stage(np.zeros(64, dtype=np.float32)), 0)
+        with self.assertRaises(ValueError):
+            PartitionedConvolutionStage(self.ir, 64, num_chan=4)
+
+
+class TestParametricEQStage(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        self.fs = 48000
+        self.bands = [(100, 20, 2), (1000, 10, 2), (8000, -10, 2, 'peak')]
+
+    def gain_db(self, eq, f):
+        _, h = signal.sosfreqz(eq.sos.astype(np.float64), worN=[f], fs=self.fs)
+        return 20 * np.log10(np.abs(h[0]))
+
+    def test_band_gains(self):
+        eq = ParametricEQStage(self.bands, self.fs, num_chan=2)
+        self.assertEqual(eq.sos.shape, (3, 6))
+        self.assertAlmostEqual(self.gain_db(eq, 1000), 10, delta=0.5)
+        self.assertAlmostEqual(self.gain_db(eq, 8000), -10, delta=0.5)
+        x = np.random.RandomState(4).uniform(-0.01, 0.01, (2048, 2))
+        y = run_frames(eq, x, 256)
+        npt.assert_allclose(y, signal.sosfilt(eq.sos.astype(np.float64), x, axis=0), atol=1e-4)
+
+    def test_set_band(self):
+        eq = ParametricEQStage(self.bands, self.fs)
+        sos = eq.sos
+        eq.set_band(2, gain_db=6)
+        self.assertIs(eq.sos, sos)
+        eq(np.zeros(256, dtype=np.float32))
+        self.assertIsNot(eq.sos, sos)
+        npt.assert_equal(eq.sos[:2], sos[:2])
+        self.assertAlmostEqual(self.gain_db(eq, 8000), 6, delta=0.5)
+        self.assertEqual(eq.bands[2], {'fc': 8000, 'gain_db': 6, 'Q': 2, 'kind': 'peak'})
+
+    def test_set_band_float64(self):
+        eq = ParametricEQStage(self.bands, self.fs, dtype=np.float64)
+        sos = eq.sos.copy()
+        self.assertFalse(np.shares_memory(eq.sos, eq._sections))
+        eq.set_band(1, gain_db=-3)
+        # The live filter is untouched until the audio thread takes over the new design
+        npt.assert_equal(eq.sos, sos)
+        eq(np.zeros(256))
+        self.assertAlmostEqual(self.gain_db(eq, 1000), -3, delta=0.5)
+        self.assertFalse(np.shares_memory(eq.sos, eq._sections))
+        eq.set_band(1, gain_db=3)
+        self.assertAlmostEqual(self.gain_db(eq, 1000), -3, delta=0.5)
+
+    def test_shelves(self):
+        eq = ParametricEQStage([(200, 6, 0.707, 'lowshelf'), (5000, -6, 0.707, 'highshelf')], self.fs)
+        self.assertAlmostEqual(self.gain_db(eq, 20), 6, delta=0.1)
+        self.assertAlmostEqual(self.gain_db(eq, 20000), -6, delta=0.2)
+        with self.assertRaises(ValueError):
+            eq_section(1000, 6, 1, self.fs, kind='notch')
+
+
+class TestCoefficientSwap(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        rng = np.random.RandomState(5)
+        self.x = rng.uniform(-0.5, 0.5, 2048)
+
+    def test_crossfade(self):
+        stage = FIRStage([1.0])
+        npt.assert_equal(stage(np.ones(256, dtype=np.float32)), 1)
+        stage.set_coefficients([0.5])
+        npt.assert_equal(stage.b, 1)
+        y = stage(np.ones(256, dtype=np.float32))
+        self.assertTrue(np.all(np.diff(y) < 0))
+        self.assertAlmostEqual(y[0], 1, places=3)
+        self.assertAlmostEqual(y[-1], 0.5, places=3)
+        npt.assert_equal(stage(np.ones(256, dtype=np.float32)), 0.5)
+        npt.assert_equal(stage.b, 0.5)
+
+    def test_order_change(self):
+        stage = IIRStage(*signal.butter(2, 0.05))
+        y1 = run_frames(stage, self.x[:1024], 256)
+        stage.set_coefficients(*signal.butter(6, 0.05))
+        y2 = run_frames(stage, self.x[1024:], 256)
+        self.assertEqual(stage.zi.shape, (6, 1))
+        y = np.concatenate((y1, y2))
+        self.assertTrue(np.all(np.isfinite(y)))
+        self.assertLess(np.max(np.abs(np.diff(y))), 0.05)
+
+    def test_swap_carries_input_history(self):
+        ir1, ir2 = signal.firwin(300, 0.1), signal.firwin(300, 0.3)
+        for stage in (FFTFIRStage(ir1, 256), PartitionedConvolutionStage(ir1, 128)):
+            n = stage.frame_length
+            y1 = run_frames(stage, self.x[:1024], n)
+            stage.set_coefficients(ir2)
+            y2 = run_frames(stage, self.x[1024:], n)
+            npt.assert_allclose(y1, np.convolve(self.x, ir1)[:1024], atol=1e-5)
+            # Exact with the new response from the frame after the crossfade
+            npt.assert_allclose(y2[n:], np.convolve(self.x, ir2)[1024 + n:2048], atol=1e-5)
+
+    def test_swap_partition_count_change(self):
+        rng = np.random.RandomState(6)
+        decay = np.exp(-np.arange(1000) / 300.0)
+        ir_long, ir_short = rng.randn(1000) * decay, rng.randn(300) * decay[:300]
+        n, swap_frame = 128, 10
+        for ir1, ir2 in ((ir_long, ir_short), (ir_short, ir_long)):
+            stage = PartitionedConvolutionStage(ir1, n)
+            n_kept = stage.n_partitions
+            run_frames(stage, self.x[:swap_frame * n], n)
+            stage.set_coefficients(ir2)
+            y = run_frames(stage, self.x[swap_frame * n:], n)
+            # Exact once the new response reaches no further back than the old
+            # delay line did, which is right after the swap frame when shortening
+            start = n * max(1, stage.n_partitions - n_kept - 1)
+            npt.assert_allclose(y[start:], np.convolve(self.x, ir2)[swap_frame * n + start:2048], atol=1e-5)
+        self.assertEqual(stage.n_partitions, 8)
+
+    def test_swap_checks_design(self):
+        stage = FIRStage([1.0], num_chan=2)
+        with self.assertRaises(ValueError):
+            stage.swap(SOSStage(signal.butter(2, 0.1, output='sos'), num_chan=2))
+        with self.assertRaises(ValueError):
+            stage.swap(FIRStage([1.0]))
+
+    def test_swap_checks_frame_length(self):
+        b = signal.firwin(300, 0.1)
+        for stage_class in (FFTFIRStage, PartitionedConvolutionStage):
+            stage = stage_class(b, 256)
+            # Rejected in the calling thread, before the audio thread sees it
+            with self.assertRaises(ValueError):
+                stage.swap(stage_class(b, 128))
+            self.assertIsNone(stage._pending)
+            stage.swap(stage_class(b, 256))
@@ -9,3 +9,12 @@ class TestImports(TestCase):
 
     def test_pyaudio_helper_import(self):
         import sk_dsp_comm.pyaudio_helper.pyaudio_helper
+
+    def test_package_namespace(self):
+        import sk_dsp_comm.pyaudio_helper as pah
+        self.assertEqual(pah.logger.name, 'sk_dsp_comm.pyaudio_helper.pyaudio_helper')
+        for name in ('signal', 'json', 'os', 'threading', 'wave'):
+            self.assertFalse(hasattr(pah, name), name)
+        for name in ('SampleConverter', 'DeviceRegistry', 'CallbackTimer', 'paInputOverflow', 'mls_probe',
+                     'SimulatedPyAudio', 'batch_render', 'deadline_sweep', 'SOSStage', 'fir_stage'):
+            self.assertTrue(hasattr(pah, name), name)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+import numpy as np
+from numpy import testing as npt
+from sk_dsp_comm.pyaudio_helper import sample_formats as sf
+
+
+class TestSampleConverter(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        self.y = np.array([0, 0.5, -0.5, 0.25, -1, 0.75, 0.125, -0.375])
+
+    def test_round_trip_integer_formats(self):
+        for fmt in (sf.paInt16, sf.paInt24, sf.paInt32):
+            conv = sf.SampleConverter(fmt, frame_length=4, num_chan=2)
+            out_data = conv.from_float(self.y).tobytes()
+            self.assertEqual(len(out_data), len(self.y) * sf.sample_size(fmt))
+            npt.assert_almost_equal(conv.to_float(out_data), self.y)
+
+    def test_int16_matches_astype(self):
+        conv = sf.SampleConverter(sf.paInt16, frame_length=8)
+        raw = conv.from_float(self.y)
+        npt.assert_equal(raw, (self.y * 32768).clip(-32768, 32767).astype(np.int16))
+
+    def test_saturating_clip(self):
+        conv = sf.SampleConverter(sf.paInt24, frame_length=2)
+        x = conv.to_float(conv.from_float(np.array([4.0, -4.0])).tobytes())
+        npt.assert_almost_equal(x, [1 - 2.0 ** -23, -1.0])
+
+    def test_float32_passthrough(self):
+        conv = sf.SampleConverter(sf.paFloat32, frame_length=8)
+        y = self.y.astype(np.float32)
+        self.assertTrue(np.shares_memory(conv.from_float(y), y))
+        npt.assert_equal(conv.to_float(y.tobytes()), y)
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            sf.SampleConverter(16)
@@ -0,0 +1,235 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+from numpy import testing as npt
+from sk_dsp_comm.pyaudio_helper.pyaudio_helper import DSPIOStream
+from sk_dsp_comm.pyaudio_helper.sample_formats import paFloat32, paInt24
+from sk_dsp_comm.pyaudio_helper.simulated import SimulatedPyAudio, read_wav, write_wav
+from sk_dsp_comm.pyaudio_helper.timing import paInputOverflow
+
+
+class TestSimulatedStream(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        self.fs = 8000
+        self.x = 0.5 * np.sin(2 * np.pi * 440 / self.fs * np.arange(4000))
+
+    def make_stream(self, sim, **kwargs):
+        kwargs.setdefault('frame_length', 256)
+        kwargs.setdefault('fs', self.fs)
+        dsp_io = DSPIOStream(in_idx=0, out_idx=0, backend=sim, **kwargs)
+        dsp_io.print_when_done = 0
+        return dsp_io
+
+    def test_process_to_end_of_input(self):
+        sim = SimulatedPyAudio(self.x, fs=self.fs)
+        dsp_io = self.make_stream(sim, process=lambda x: 0.5 * x, t_capture=1, sample_format=paFloat32)
+        dsp_io.stream(t_sec=0)
+        y = sim.output_signal()
+        self.assertEqual(len(y), 16 * 256)
+        npt.assert_almost_equal(y[:len(self.x)], 0.5 * self.x, decimal=6)
+        npt.assert_almost_equal(dsp_io.data_capture[:len(self.x)], 0.5 * self.x, decimal=6)
+        stats = dsp_io.stream_stats()
+        self.assertEqual(stats['n_callbacks'], 16)
+        self.assertAlmostEqual(stats['latency']['io']['mean'], 15)
+
+    def test_backend_not_terminated(self):
+        sim = SimulatedPyAudio(self.x, fs=self.fs)
+        dsp_io = self.make_stream(sim, process=lambda x: x)
+        self.assertFalse(sim.terminated)
+        dsp_io.stream(t_sec=0)
+        dsp_io.close()
+        self.assertFalse(sim.terminated)
+        self.assertEqual(len(sim.output_signal()), 16 * 256)
+
+    def test_timed_stream_ends_on_frame(self):
+        sim = SimulatedPyAudio(fs=self.fs)
+        dsp_io = self.make_stream(sim, process=lambda x: x)
+        dsp_io.stream(t_sec=0.1)
+        self.assertEqual(len(sim.output_signal()), 4 * 256)
+        # The same object streams again on the same backend
+        dsp_io.stream(t_sec=0.2)
+        self.assertEqual(len(sim.output_signal()), 7 * 256)
+
+    def test_stop_infinite_realtime_stream(self):
+        sim = SimulatedPyAudio(fs=self.fs, realtime=True)
+        dsp_io = self.make_stream(sim, process=lambda x: x, sleep_time=1.0)
+        t = threading.Thread(target=dsp_io.stream, kwargs={'t_sec': 0})
+        t.start()
+        while dsp_io.capture_sample_count < 2 * 256 and t.is_alive():
+            time.sleep(0.005)
+        start = time.perf_counter()
+        dsp_io.stop()
+        t.join(5)
+        elapsed = time.perf_counter() - start
+        self.assertFalse(t.is_alive())
+        # One 256 sample frame is 32 ms, well short of sleep_time
+        self.assertLess(elapsed, 0.5)
+
+    def test_stereo_callback(self):
+        x = np.column_stack((self.x, -self.x))
+        sim = SimulatedPyAudio(x, fs=self.fs)
+
+        def callback(in_data, frame_count, time_info, status):
+            left, right = dsp_io.get_lr(dsp_io.in_data_to_float(in_data))
+            dsp_io.DSP_capture_add_samples_stereo(right, left)
+            return dsp_io.float_to_out_data(dsp_io.pack_lr(right, left)).tobytes(), 0
+
+        dsp_io = self.make_stream(sim, stream_callback=callback, t_capture=1, num_chan=2)
+        dsp_io.stream(t_sec=0, num_chan=2)
+        y = sim.output_signal()
+        npt.assert_almost_equal(y[:len(x)], x[:, ::-1], decimal=4)
+        npt.assert_almost_equal(dsp_io.data_capture_left[:len(x)], -self.x, decimal=4)
+
+    def test_timed_stereo_callback(self):
+        sim = SimulatedPyAudio(fs=self.fs)
+
+        def callback(in_data, frame_count, time_info, status):
+            left, right = dsp_io.get_lr(dsp_io.in_data_to_float(in_data))
+            dsp_io.DSP_capture_add_samples_stereo(left, right)
+            return dsp_io.float_to_out_data(dsp_io.pack_lr(left, right)).tobytes(), 0
+
+        dsp_io = self.make_stream(sim, stream_callback=callback, num_chan=2)
+        dsp_io.stream(t_sec=0.5, num_chan=2)
+        # 4000 samples per channel take 16 frames, the same as with the multichannel capture
+        self.assertEqual(len(sim.output_signal()), 16 * 256)
+
+    def test_status_flags_counted(self):
+        sim = SimulatedPyAudio(self.x, fs=self.fs, status=lambda k: paInputOverflow if k % 4 == 1 else 0)
+        dsp_io = self.make_stream(sim, process=lambda x: x, sample_format=paInt24)
+        dsp_io.stream(t_sec=0)
+        self.assertEqual(dsp_io.stream_stats()['status_counts']['input_overflow'], 4)
+        npt.assert_equal(dsp_io.status_log.events()[0], [1, 5, 9, 13])
+
+    def test_loopback_latency(self):
+        sim = SimulatedPyAudio(fs=self.fs, loopback=True, loopback_delay=700)
+        dsp_io = self.make_stream(sim, process=lambda x: x)
+        result = dsp_io.measure_round_trip_latency(probe='mls', n_trials=2, t_listen=0.2)
+        npt.assert_equal(result['delays'], [700, 700])
+
+    def test_invalid_device(self):
+        with self.assertRaises(ValueError):
+            DSPIOStream(process=lambda x: x, in_idx=2, out_idx=0, backend=SimulatedPyAudio())
+
+    def test_wav_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'x.wav')
+            write_wav(filename, self.fs, np.column_stack((self.x, -self.x)))
+            fs, x = read_wav(filename)
+        self.assertEqual(fs, self.fs)
+        npt.assert_almost_equal(x[:, 1], -self.x, decimal=4)
+
+
+class TestRender(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_render_legacy_callback(self):
+        x = np.linspace(-0.45, 0.45, 1000)
+
+        def callback(in_data, frame_count, time_info, status):
+            dsp_io.DSP_callback_tic()
+            y = 2 * np.frombuffer(in_data, dtype=np.int16).astype(np.float32)
+            dsp_io.DSP_capture_add_samples(y)
+            dsp_io.DSP_callback_toc()
+            return y.astype(np.int16).tobytes(), 0
+
+        dsp_io = DSPIOStream(callback, in_idx=0, out_idx=0, frame_length=128, fs=8000, t_capture=1,
+                             backend=SimulatedPyAudio())
+        result = dsp_io.render(x)
+        npt.assert_almost_equal(result.output, 2 * x, decimal=4)
+        self.assertEqual(len(result.data_capture), 8 * 128)
+        self.assertEqual(result.stats['n_callbacks'], 8)
+        self.assertEqual(len(result.DSP_tic), 8)
+
+    def test_render_stereo_process_timed(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (3000, 2))
+        dsp_io = DSPIOStream(process=lambda x: x[:, ::-1], in_idx=0, out_idx=0, frame_length=100, fs=8000,
+                             sample_format=paFloat32, backend=SimulatedPyAudio())
+        result = dsp_io.render(x, t_sec=0.1)
+        self.assertEqual(result.output.shape, (800, 2))
+        npt.assert_almost_equal(result.output, x[:800, ::-1], decimal=6)
+
+    def test_render_process_out(self):
+        x = np.linspace(-0.45, 0.45, 1000)
+
+        def process(x, out):
+            np.multiply(x, 0.5, out=out)
+
+        dsp_io = DSPIOStream(process=process, process_out=True, in_idx=0, out_idx=0, frame_length=128, fs=8000,
+                             sample_format=paFloat32, backend=SimulatedPyAudio())
+        result = dsp_io.render(x)
+        self.assertEqual(result.output.shape, (1000,))
+        npt.assert_almost_equal(result.output, 0.5 * x, decimal=6)
+
+    def test_render_process_out_multichannel(self):
+        x = np.random.RandomState(0).uniform(-0.5, 0.5, (1000, 3))
+
+        def process(x, out):
+            out[:] = x[:, ::-1]
+
+        dsp_io = DSPIOStream(process=process, process_out=True, in_idx=0, out_idx=0, frame_length=128, fs=8000,
+                             sample_format=paFloat32, backend=SimulatedPyAudio())
+        result = dsp_io.render(x)
+        self.assertEqual(result.output.shape, (1000, 3))
+        npt.assert_almost_equal(result.output, x[:, ::-1], decimal=6)
+
+    def test_render_wav(self):
+        x = np.linspace(-0.45, 0.45, 1000)
+        dsp_io = DSPIOStream(process=lambda x: x, in_idx=0, out_idx=0, frame_length=128, fs=8000,
+                             backend=SimulatedPyAudio())
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'x.wav')
+            write_wav(filename, 8000, x)
+            npt.assert_almost_equal(dsp_io.render(filename).output, x, decimal=4)
+            write_wav(filename, 16000, x)
+            with self.assertRaises(ValueError):
+                dsp_io.render(filename)
+
+
+class TestCbActivePlot(TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        self.dsp_io = DSPIOStream(process=lambda x: x, in_idx=0, out_idx=0, backend=SimulatedPyAudio())
+        plt.figure()
+
+    def tearDown(self):
+        plt.close('all')
+
+    def set_timing(self, tics_ms, tocs_ms):
+        timer = self.dsp_io.timer
+        timer.start_ns = 0
+        timer.tic_ns[:len(tics_ms)] = np.asarray(tics_ms) * 1000000
+        timer.toc_ns[:len(tocs_ms)] = np.asarray(tocs_ms) * 1000000
+        timer.count = len(tics_ms)
+
+    def assert_single_trace(self, start_ms, stop_ms):
+        self.dsp_io.cb_active_plot(start_ms, stop_ms)
+        lines = plt.gca().get_lines()
+        self.assertEqual(len(lines), 1)
+        t = lines[0].get_xdata()
+        self.assertTrue(np.all(np.diff(t) >= 0))
+        self.assertEqual(plt.gca().get_xlim(), (start_ms, stop_ms))
+        return lines[0]
+
+    def test_empty_timer(self):
+        line = self.assert_single_trace(0, 10)
+        npt.assert_equal(line.get_ydata(), [0, 0])
+
+    def test_window_before_first_callback(self):
+        self.set_timing([10, 20, 30], [12, 22, 32])
+        line = self.assert_single_trace(0, 5)
+        npt.assert_equal(line.get_ydata(), [0, 0])
+
+    def test_window_after_last_callback(self):
+        self.set_timing([10, 20, 30], [12, 22, 32])
+        line = self.assert_single_trace(50, 60)
+        npt.assert_almost_equal(line.get_xdata(), [22, 30, 30, 32, 32, 60])
+        npt.assert_equal(line.get_ydata(), [0, 0, 1, 1, 0, 0])
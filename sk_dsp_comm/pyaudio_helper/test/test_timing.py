@@ -0,0 +1,85 @@
+from unittest import TestCase
+import numpy as np
+from sk_dsp_comm.pyaudio_helper.timing import CallbackTimer, StatusLog, LatencyTracker, timing_stats
+from sk_dsp_comm.pyaudio_helper.timing import paInputOverflow, paOutputUnderflow
+
+
+class TestCallbackTimer(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_tic_toc_pairs(self):
+        timer = CallbackTimer(8)
+        for k in range(5):
+            timer.tic()
+            timer.toc()
+        self.assertEqual(len(timer), 5)
+        self.assertTrue(np.all(timer.tocs() >= timer.tics()))
+        self.assertTrue(np.all(np.diff(timer.tics()) >= 0))
+        self.assertEqual(timer.first_tic, timer.tics()[0])
+
+    def test_ring_keeps_newest(self):
+        timer = CallbackTimer(4)
+        for k in range(10):
+            timer.tic()
+            timer.toc()
+        self.assertEqual(len(timer), 4)
+        self.assertEqual(timer.count, 10)
+        self.assertTrue(np.all(np.diff(timer.tics()) >= 0))
+        self.assertLess(timer.first_tic, timer.tics()[0])
+
+
+class TestTimingStats(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_stats(self):
+        tic = np.arange(10) * 0.01
+        toc = tic + np.r_[np.full(9, 0.002), 0.015]
+        stats = timing_stats(tic, toc, 0.01, first_tic=0.0)
+        self.assertEqual(stats['n_callbacks'], 10)
+        self.assertAlmostEqual(stats['period_mean_ms'], 10)
+        self.assertAlmostEqual(stats['period_jitter_ms'], 0)
+        self.assertAlmostEqual(stats['process_p50_ms'], 2)
+        self.assertAlmostEqual(stats['process_max_ms'], 15)
+        self.assertAlmostEqual(stats['cpu_load'], 0.33)
+        self.assertEqual(stats['deadline_misses'], 1)
+
+    def test_stats_empty(self):
+        stats = timing_stats([], [], 0.01)
+        self.assertEqual(stats['n_callbacks'], 0)
+        self.assertEqual(stats['deadline_misses'], 0)
+        self.assertTrue(np.isnan(stats['process_mean_ms']))
+
+
+class TestStatusLog(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_counts_and_bounded_log(self):
+        log = StatusLog(n_events=2)
+        log.record(0, 0, 0.0)
+        log.record(paInputOverflow, 3, 0.1)
+        log.record(paInputOverflow | paOutputUnderflow, 5, 0.2)
+        log.record(paOutputUnderflow, 9, 0.3)
+        counts = log.count_dict()
+        self.assertEqual(counts['input_overflow'], 2)
+        self.assertEqual(counts['output_underflow'], 2)
+        self.assertEqual(counts['input_underflow'], 0)
+        frame_index, t, status = log.events()
+        np.testing.assert_equal(frame_index, [5, 9])
+        np.testing.assert_equal(status, [paInputOverflow | paOutputUnderflow, paOutputUnderflow])
+
+
+class TestLatencyTracker(TestCase):
+    _multiprocess_can_split_ = True
+
+    def test_latency_from_time_info(self):
+        tracker = LatencyTracker()
+        for k, dac in enumerate([1.030, 2.034]):
+            tracker.record({'input_buffer_adc_time': k + 1.0, 'current_time': k + 1.010,
+                            'output_buffer_dac_time': dac})
+        tracker.record({'input_buffer_adc_time': 0, 'current_time': 3.0, 'output_buffer_dac_time': 0})
+        stats = tracker.stats()
+        self.assertEqual(stats['io']['count'], 2)
+        self.assertAlmostEqual(stats['io']['mean'], 32)
+        self.assertAlmostEqual(stats['io']['max'], 34)
+        self.assertAlmostEqual(stats['input']['mean'], 10)
+        self.assertAlmostEqual(stats['output']['last'], 24)
@@ -0,0 +1,301 @@
+"""
+Callback timing and stream statistics recorders
+"""
+
+import time
+import numpy as np
+
+try:
+    from time import perf_counter_ns
+except ImportError:  # Python < 3.7
+    def perf_counter_ns():
+        return int(time.perf_counter() * 1e9)
+
+__all__ = ['paContinue', 'paComplete', 'paAbort', 'paInputUnderflow', 'paInputOverflow', 'paOutputUnderflow',
+           'paOutputOverflow', 'paPrimingOutput', 'status_flags', 'CallbackTimer', 'StatusLog', 'RunningStats',
+           'LatencyTracker', 'timing_stats']
+
+# PortAudio callback return flags, same values as pyaudio.paContinue, ...
+paContinue = 0
+paComplete = 1
+paAbort = 2
+
+# PortAudio callback status flags, same values as pyaudio.paInputUnderflow, ...
+paInputUnderflow = 1
+paInputOverflow = 2
+paOutputUnderflow = 4
+paOutputOverflow = 8
+paPrimingOutput = 16
+
+status_flags = (('input_underflow', paInputUnderflow),
+                ('input_overflow', paInputOverflow),
+                ('output_underflow', paOutputUnderflow),
+                ('output_overflow', paOutputOverflow),
+                ('priming_output', paPrimingOutput))
+
+
+class CallbackTimer(object):
+    """
+    Fixed size ring of perf_counter_ns tic/toc pairs, one pair per callback.
+
+    Recording a pair is two integer stores into preallocated arrays, cheap
+    enough to leave on in every stream. Once n_records callbacks have been
+    timed the oldest pairs are overwritten.
+    """
+
+    def __init__(self, n_records=65536):
+        """
+        :param n_records: Number of callbacks to keep timing for
+        """
+        self.n_records = n_records
+        self.tic_ns = np.zeros(n_records, dtype=np.int64)
+        self.toc_ns = np.zeros(n_records, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all timing and restart the time reference at now.
+        """
+        self.start_ns = perf_counter_ns()
+        self.first_tic_ns = None
+        self.count = 0
+
+    def tic(self):
+        """
+        Record the time a callback starts.
+        """
+        t = perf_counter_ns()
+        self.tic_ns[self.count % self.n_records] = t
+        if self.first_tic_ns is None:
+            self.first_tic_ns = t
+
+    def toc(self):
+        """
+        Record the time a callback ends, completing its tic/toc pair.
+        """
+        self.toc_ns[self.count % self.n_records] = perf_counter_ns()
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.n_records)
+
+    def _chronological(self, times_ns):
+        n = len(self)
+        start = self.count % self.n_records if self.count > self.n_records else 0
+        idx = (start + np.arange(n)) % self.n_records
+        return (times_ns[idx] - self.start_ns) * 1e-9
+
+    def tics(self):
+        """
+        :return: Callback start times in seconds since reset, oldest first
+        """
+        return self._chronological(self.tic_ns)
+
+    def tocs(self):
+        """
+        :return: Callback end times in seconds since reset, oldest first
+        """
+        return self._chronological(self.toc_ns)
+
+    @property
+    def first_tic(self):
+        """
+        Seconds from reset to the first callback, None before any callback.
+        """
+        if self.first_tic_ns is None:
+            return None
+        return (self.first_tic_ns - self.start_ns) * 1e-9
+
+
+class StatusLog(object):
+    """
+    Count the PortAudio status flags reported to the callback, e.g.
+    paInputOverflow and paOutputUnderflow, and keep a bounded log of the
+    callbacks that reported any, so dropouts can be matched to callback timing.
+    """
+
+    def __init__(self, n_events=1024):
+        """
+        :param n_events: Number of newest status events to keep
+        """
+        self.n_events = n_events
+        self.counts = np.zeros(len(status_flags), dtype=np.int64)
+        self.frame_index = np.zeros(n_events, dtype=np.int64)
+        self.time = np.zeros(n_events)
+        self.status = np.zeros(n_events, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        """
+        Clear the counts and the event log.
+        """
+        self.counts[:] = 0
+        self.n_total = 0
+
+    def record(self, status, frame_index, t):
+        """
+        Record the status of one callback, nothing is logged for status 0.
+
+        :param status: status argument of the callback
+        :param frame_index: Index of the callback since the stream started
+        :param t: Time of the callback in seconds
+        """
+        if not status:
+            return
+        for k, (name, flag) in enumerate(status_flags):
+            if status & flag:
+                self.counts[k] += 1
+        idx = self.n_total % self.n_events
+        self.frame_index[idx] = frame_index
+        self.time[idx] = t
+        self.status[idx] = status
+        self.n_total += 1
+
+    def count_dict(self):
+        """
+        :return: Dictionary of the number of callbacks that reported each flag
+        """
+        return {name: int(count) for (name, flag), count in zip(status_flags, self.counts)}
+
+    def events(self):
+        """
+        :return: Tuple of arrays (frame_index, time, status) of the logged events, oldest first
+        """
+        n = min(self.n_total, self.n_events)
+        start = self.n_total % self.n_events if self.n_total > self.n_events else 0
+        idx = (start + np.arange(n)) % self.n_events
+        return self.frame_index[idx], self.time[idx], self.status[idx]
+
+
+class RunningStats(object):
+    """
+    Running count, mean, standard deviation, min, max and last value of a
+    sequence, updated in constant time per value (Welford's method).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.last = np.nan
+
+    def add(self, value):
+        """
+        Add one value.
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.last = value
+
+    @property
+    def std(self):
+        return np.sqrt(self._m2 / self.count) if self.count else np.nan
+
+    def as_dict(self, scale=1.0):
+        """
+        :param scale: Factor applied to the values, e.g. 1000 for seconds to ms
+        :return: Dictionary with the keys count, mean, std, min, max and last
+        """
+        if not self.count:
+            return {'count': 0, 'mean': np.nan, 'std': np.nan, 'min': np.nan, 'max': np.nan, 'last': np.nan}
+        return {'count': self.count, 'mean': self.mean * scale, 'std': self.std * scale,
+                'min': self.min * scale, 'max': self.max * scale, 'last': self.last * scale}
+
+
+class LatencyTracker(object):
+    """
+    Track device latency from the callback time_info timestamps.
+
+    For every callback the input latency (current_time - input_buffer_adc_time),
+    output latency (output_buffer_dac_time - current_time) and their sum, the
+    input to output latency, are added to running statistics. Callbacks whose
+    host API reports zero timestamps are skipped.
+    """
+
+    def __init__(self):
+        self.input = RunningStats()
+        self.output = RunningStats()
+        self.io = RunningStats()
+        self.reported = {'input': np.nan, 'output': np.nan}
+
+    def reset(self):
+        self.input.reset()
+        self.output.reset()
+        self.io.reset()
+        self.reported = {'input': np.nan, 'output': np.nan}
+
+    def record(self, time_info):
+        """
+        :param time_info: time_info dictionary passed to the callback
+        """
+        adc = time_info.get('input_buffer_adc_time', 0)
+        now = time_info.get('current_time', 0)
+        dac = time_info.get('output_buffer_dac_time', 0)
+        if adc and dac:
+            self.io.add(dac - adc)
+            if now:
+                self.input.add(now - adc)
+                self.output.add(dac - now)
+
+    def record_stream(self, stream):
+        """
+        Record the latencies the opened stream reports, in seconds.
+        """
+        self.reported = {'input': stream.get_input_latency(), 'output': stream.get_output_latency()}
+
+    def stats(self):
+        """
+        :return: Dictionary of running statistics in ms for io, input and output,
+                 plus the stream reported latencies in ms
+        """
+        return {'io': self.io.as_dict(1000), 'input': self.input.as_dict(1000),
+                'output': self.output.as_dict(1000),
+                'reported_input_ms': self.reported['input'] * 1000,
+                'reported_output_ms': self.reported['output'] * 1000}
+
+
+def timing_stats(tic, toc, period, first_tic=None):
+    """
+    Summarize callback timing against the real-time deadline.
+
+    :param tic: Callback start times in seconds
+    :param toc: Callback end times in seconds
+    :param period: Ideal callback period frame_length / fs in seconds
+    :param first_tic: Delay from the stream start to the first callback in seconds
+    :return: Dictionary of statistics, times in ms. cpu_load is the processing
+             time as a fraction of the period and deadline_misses counts the
+             callbacks that took longer than one period.
+    """
+    tic = np.asarray(tic, dtype=np.float64)
+    process = (np.asarray(toc, dtype=np.float64) - tic) * 1000
+    # Skip the first period, as stream_stats always has
+    periods = np.diff(tic)[1:] * 1000
+    period_ms = period * 1000
+    stats = {'n_callbacks': len(tic),
+             'first_callback_delay_ms': np.nan if first_tic is None else first_tic * 1000,
+             'period_ideal_ms': period_ms,
+             'period_mean_ms': np.nan, 'period_jitter_ms': np.nan, 'period_max_dev_ms': np.nan,
+             'process_mean_ms': np.nan, 'process_p50_ms': np.nan, 'process_p95_ms': np.nan,
+             'process_p99_ms': np.nan, 'process_max_ms': np.nan,
+             'cpu_load': np.nan, 'cpu_load_max': np.nan,
+             'deadline_misses': 0}
+    if len(periods):
+        stats['period_mean_ms'] = np.mean(periods)
+        stats['period_jitter_ms'] = np.std(periods)
+        stats['period_max_dev_ms'] = np.max(np.abs(periods - period_ms))
+    if len(process):
+        p50, p95, p99 = np.percentile(process, [50, 95, 99])
+        stats.update(process_mean_ms=np.mean(process), process_p50_ms=p50, process_p95_ms=p95,
+                     process_p99_ms=p99, process_max_ms=np.max(process),
+                     cpu_load=np.mean(process) / period_ms, cpu_load_max=np.max(process) / period_ms,
+                     deadline_misses=int(np.count_nonzero(process > period_ms)))
+    return stats